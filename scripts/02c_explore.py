@@ -9,6 +9,12 @@ The outputs are used to identify and prioritize execution gaps based on lateness
 quantity tolerance violations, and value exposure, supporting fact based
 management decision making.
 
+Usage
+python 02c_explore.py [CSV] [-o OUT_DIR] [--dims DIM ...] [--tables-only | --plots --flags] [--ci] [--preview [FRACTION]]
+                      [--activities CSV]
+Without arguments, the module constants below apply (CSV_PATH, OUT_DIR,
+OUTPUTS, ...). Table and flag runs never import matplotlib; see --help.
+
 Notes
 Parts of the code were developed with assistance from GitHub Copilot.
 logic, structure, and analytical decisions were reviewed and validated by the authors.
@@ -17,13 +23,38 @@ logic, structure, and analytical decisions were reviewed and validated by the au
 
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
+import inspect
 import math
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter, MaxNLocator
-from matplotlib.patches import Rectangle, FancyArrowPatch
+# matplotlib is imported inside the plot functions: table and flag runs never load it
+
+from case_ingest import parse_eu_number, parse_eu_numbers, read_case_table
+import case_ingest
+import kpi_cache
+from otif_agg import rate_tables
+import otif_agg
+import otif_cube
+import otif_query
+import subgroups
+from plot_render import PlotSpec, default_workers, render_plots
+import otif_incremental
+import otif_chunked
+import otif_trend
+import otif_preview
+import dq_flags
+import event_log
+import execution_gaps
+import dfg
+import tpt
+import variants
+import case_memory
+import rate_ci
+import run_report
+from run_report import stage
+from stage_dag import Node, run_dag
 
 # =============================================================================
 # Paths
@@ -37,14 +68,118 @@ PLOTS_DIR = OUT_DIR / "plots"
 TABLES_DIR = OUT_DIR / "tables"
 FLAGS_DIR = OUT_DIR / "flags"
 
-for d in [PLOTS_DIR, TABLES_DIR, FLAGS_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
-
-CSV_PATH = PROJECT_ROOT / r"data\8c) Woodcorp O2C Case table.csv"
+CSV_PATH = PROJECT_ROOT / "data" / "8c) Woodcorp O2C Case table.csv"
 
 TOP_N = 15
 MIN_CASES = 200
 
+# Cleaned + KPI-engineered case table is cached as Parquet (see kpi_cache.py).
+# Bump KPI_VERSION for KPI changes outside engineer_kpis/prepare_cases.
+KPI_VERSION = "1"
+USE_CACHE = True
+REBUILD_CACHE = False  # <- set True to force a rebuild
+
+# True: write the per-column footprint before/after compaction (see case_memory.py)
+# to OUT_DIR/memory_report.csv whenever the case table is built (not on cache hits).
+MEMORY_REPORT = False
+
+PLOT_WORKERS = default_workers()  # <- 1 renders serially in-process
+
+# True: fold CSV_PATH as a new batch into the state stored in OUT_DIR/.otif_state
+# (see otif_incremental.py) and report from that state instead of re-reading the
+# full history. Each run folder keeps its own state.
+INCREMENTAL = False
+
+# Rows per chunk for tables larger than RAM (see otif_chunked.py); None reads
+# the whole table at once.
+CHUNK_ROWS = None  # <- e.g. 250_000
+
+# True: preview the rate tables and ranking from a stratified sample (see
+# otif_preview.py) -> OUT_DIR/preview/, with sampling error bounds and
+# rank_uncertain flags. Every dimension member keeps PREVIEW_MIN_PER_MEMBER cases.
+PREVIEW = False
+PREVIEW_FRACTION = 0.02  # <- share of cases sampled on top of the member minimum
+PREVIEW_MIN_PER_MEMBER = 100
+# columns the preview KPIs read, besides the dimensions
+PREVIEW_COLUMNS = ["CASE_KEY", "ORDERED_QUANTITY", "DELIVERED_QUANTITY", "MIN_ORDER_TOLERANCE",
+                   "MAX_ORDER_TOLERANCE", "DELIVERED_DATE", "PROMISED_DATE", "ORDER_VALUE"]
+
+# Port for the local filter query service (see otif_query.py), started after
+# a full run; None skips it.
+QUERY_PORT = None  # <- e.g. 8765
+
+# True: beam search for multi-attribute high-failure segments (see subgroups.py)
+# -> otif_subgroups_ranking.csv, support pruned at MIN_CASES.
+SUBGROUP_DISCOVERY = False
+
+# Activity table (event log, see event_log.py). Full runs with tables write the
+# process analyses from it: execution gap flags per case (execution_gaps.py)
+# -> tables/execution_gaps.csv, throughput times per dimension member split by
+# happy path (tpt.py) -> tables/tpt_by_dimension.csv + tpt_happy_path_delta.csv,
+# and directly-follows graphs per dimension member (dfg.py) -> tables/dfg.parquet
+# plus the DFG_TOP_K most frequent edges per member -> tables/dfg_top<K>.csv.
+# None, or a missing file, skips them.
+ACTIVITY_PATH = PROJECT_ROOT / "data" / "activity.csv"  # <- adjust if needed
+DFG_TOP_K = 20  # <- edges per member kept for rendering process maps
+
+# True: confidence intervals on every rates table (Wilson + bootstrap, see
+# rate_ci.py) as extra <rate>_wilson_* / <rate>_boot_* columns of the rates CSVs.
+# RANK_BY_LOWER_BOUND sorts the combined ranking by the lower Wilson bound of
+# the OTIF fail rate, so small members with a few failures drop down.
+RATE_CI = False              # <- set True (or pass --ci) to add the intervals
+RANK_BY_LOWER_BOUND = False  # <- set True to rank by the lower bound (needs RATE_CI)
+
+# Stage timings (wall, CPU, memory, rows) -> run_report.json in the run folder (see run_report.py).
+# Stages named in PROFILE_STAGES (e.g. "engineer_kpis") are also cProfiled to
+# <run dir>/profiles/; TRACE_MEMORY adds exact per-stage allocation peaks (slower).
+RUN_REPORT = True
+PROFILE_STAGES: list[str] = []
+TRACE_MEMORY = False
+
+# Full runs only rebuild tables, plots and flags whose inputs, parameters or
+# code changed (fingerprints in OUT_DIR/.stage_manifest.json, see stage_dag.py).
+SKIP_UP_TO_DATE = True  # <- set False to rebuild every artifact
+
+# OTIF trends (see otif_trend.py): rates per TREND_FREQ bucket ("week" or "month")
+# of TREND_DATE x member plus rolling rates over the trailing TREND_WINDOWS
+# buckets -> tables/trend_<slug>_<freq>.csv and small-multiple plots of the
+# TREND_TOP_N members with most cases. Full runs only.
+TREND = False  # <- set True for trend tables and plots
+TREND_DATE = "PROMISED_DATE"  # <- or "DELIVERED_DATE"
+TREND_FREQ = "week"
+TREND_WINDOWS = [4, 13]  # the plots show the first window
+TREND_TOP_N = 6
+
+# Data quality flags (see dq_flags.py): FLAG_CSVS writes one full-row CSV per
+# rule, FLAG_TABLE one compact table (CASE_KEY x rule bitmask + metrics,
+# flags/flag_table.parquet). FLAG_PROJECT keeps only the columns the rules need.
+FLAG_CSVS = True  # <- set False to write the compact table only
+FLAG_TABLE = True
+FLAG_PROJECT = False
+
+# Dimension pairs drilled down from the OTIF cube (see otif_cube.py) -> rates_<a>_x_<b>.csv
+CUBE_DIM_PAIRS = [
+    ("FACTORY", "DELIVERY_COMPANY"),
+    ("PRODUCT_TYPE", "CUST_MARKET"),
+]
+
+# Outputs of a run: any of "tables" (rates, cube tables, ranking), "plots"
+# (with the rate tables they are drawn from) and "flags"; see also the CLI in main().
+OUTPUTS = {"tables", "plots", "flags"}
+
+# Dimensions to report (column or slug from DIM_CANDIDATES); None = all present.
+DIMENSIONS: list[str] | None = None
+
+DIM_CANDIDATES = [
+    ("DELIVERY_COMPANY", "supplier", "Delivery Company"),
+    ("FACTORY", "factory", "Factory"),
+    ("PRODUCT_TYPE", "product_type", "Product Type"),
+    ("FACTORY_TYPE", "factory_type", "Factory Type"),
+    ("WAREHOUSE_TYPE", "warehouse_type", "Warehouse Type"),
+    ("CUST_MARKET", "cust_market", "Customer Market"),
+    ("CUST_COUNTRY", "cust_country", "Customer Country"),
+]
+
 # =============================================================================
 # Slide-matching palette
 # =============================================================================
@@ -62,6 +197,7 @@ PAL = {
 # Global style (matplotlib best practice for reports)
 # =============================================================================
 def apply_slide_style() -> None:
+    import matplotlib.pyplot as plt
     plt.rcParams.update({
         "figure.facecolor": PAL["bg"],
         "axes.facecolor": PAL["bg"],
@@ -83,43 +219,16 @@ def apply_slide_style() -> None:
         "legend.frameon": False,
     })
 
-apply_slide_style()
-
 # =============================================================================
 # Helpers
 # =============================================================================
 def try_read_csv(path: Path) -> pd.DataFrame:
-    if not path.exists():
-        raise FileNotFoundError(f"CSV not found: {path.resolve()}")
-    for sep in [",", ";", "\t"]:
-        try:
-            df = pd.read_csv(path, sep=sep, dtype=str, engine="python")
-            if df.shape[1] > 3:
-                return df
-        except Exception:
-            pass
-    raise ValueError("Could not read CSV robustly (check delimiter/format).")
-
-def parse_eu_number(x):
-    if pd.isna(x):
-        return np.nan
-    if isinstance(x, (int, float, np.number)):
-        return float(x)
-    s = str(x).strip().strip('"').replace(" ", "")
-    if s == "":
-        return np.nan
-    # 1.234,56 -> 1234.56 ; 123,45 -> 123.45
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    else:
-        s = s.replace(",", ".")
-    try:
-        return float(s)
-    except ValueError:
-        return np.nan
+    # Delimiter is sniffed from a head sample, then one typed Arrow/C pass.
+    return read_case_table(path)
 
 def savefig(name: str) -> Path:
-    p = PLOTS_DIR / name
+    import matplotlib.pyplot as plt
+    p = PLOTS_DIR / name  # absolute names (render workers) are kept as is
     plt.tight_layout()
     plt.savefig(p, dpi=220, bbox_inches="tight")
     plt.close()
@@ -136,8 +245,6 @@ def pct(x, _pos=None):
         return ""
     return f"{x*100:.0f}%"
 
-PCT_FMT = FuncFormatter(pct)
-
 def set_axis_from_zero(ax, which: str, data: np.ndarray, pad: float = 0.06) -> None:
     """
     Force scale to start at 0 (management convention).
@@ -177,28 +284,25 @@ def engineer_kpis(df: pd.DataFrame) -> pd.DataFrame:
     ]
     for c in num_cols:
         if c in df.columns:
-            df[c] = pd.to_numeric(df[c].apply(parse_eu_number), errors="coerce")
+            df[c] = parse_eu_numbers(df[c])
 
     for c in ["DELIVERED_DATE", "PROMISED_DATE"]:
         if c in df.columns:
             df[c] = pd.to_datetime(df[c], errors="coerce")
 
-    tmin = df.get("MIN_ORDER_TOLERANCE", pd.Series(np.nan, index=df.index)).fillna(0.0)
-    tmax = df.get("MAX_ORDER_TOLERANCE", pd.Series(np.nan, index=df.index)).fillna(0.0)
-
-    df["TOL_LOWER"] = df["ORDERED_QUANTITY"] * (1.0 + tmin / 100.0)
-    df["TOL_UPPER"] = df["ORDERED_QUANTITY"] * (1.0 + tmax / 100.0)
+    # Tolerance bounds are not stored, see case_memory.tol_bounds
+    tol_lower, tol_upper = case_memory.tol_bounds(df)
 
     df["IS_TOL_VIOLATION"] = (
-        (df["DELIVERED_QUANTITY"] < df["TOL_LOWER"]) |
-        (df["DELIVERED_QUANTITY"] > df["TOL_UPPER"])
+        (df["DELIVERED_QUANTITY"] < tol_lower) |
+        (df["DELIVERED_QUANTITY"] > tol_upper)
     ).fillna(False)
 
     df["OUTSIDE_TOL_QTY"] = 0.0
-    low = df["DELIVERED_QUANTITY"] < df["TOL_LOWER"]
-    high = df["DELIVERED_QUANTITY"] > df["TOL_UPPER"]
-    df.loc[low, "OUTSIDE_TOL_QTY"] = (df.loc[low, "TOL_LOWER"] - df.loc[low, "DELIVERED_QUANTITY"])
-    df.loc[high, "OUTSIDE_TOL_QTY"] = (df.loc[high, "DELIVERED_QUANTITY"] - df.loc[high, "TOL_UPPER"])
+    low = df["DELIVERED_QUANTITY"] < tol_lower
+    high = df["DELIVERED_QUANTITY"] > tol_upper
+    df.loc[low, "OUTSIDE_TOL_QTY"] = (tol_lower[low] - df.loc[low, "DELIVERED_QUANTITY"])
+    df.loc[high, "OUTSIDE_TOL_QTY"] = (df.loc[high, "DELIVERED_QUANTITY"] - tol_upper[high])
 
     if "DELIVERED_DATE" in df.columns and "PROMISED_DATE" in df.columns:
         df["DELTA_DAYS"] = (df["DELIVERED_DATE"] - df["PROMISED_DATE"]).dt.days
@@ -214,39 +318,18 @@ def engineer_kpis(df: pd.DataFrame) -> pd.DataFrame:
 # Group tables
 # =============================================================================
 def group_table(df: pd.DataFrame, dim: str) -> pd.DataFrame:
-    g = df.groupby(dim, dropna=False, observed=False)
-
-    out = pd.DataFrame({
-        "dimension": dim,
-        "member": g.size().index.astype(str),
-        "cases": g.size().values,
-        "late_rate_cases": g["IS_LATE"].mean().values,
-        "tol_violation_rate_cases": g["IS_TOL_VIOLATION"].mean().values,
-        "otif_fail_rate_cases": g["IS_OTIF_FAIL"].mean().values,
-        "otif_fail_cases": g["IS_OTIF_FAIL"].sum().values,
-    })
-
-    if "ORDER_VALUE" in df.columns:
-        total_val = g["ORDER_VALUE"].sum()
-        fail_val = df.loc[df["IS_OTIF_FAIL"]].groupby(dim, dropna=False, observed=False)["ORDER_VALUE"].sum()
-
-        out = out.merge(total_val.rename("sum_order_value"), left_on="member", right_index=True, how="left")
-        out = out.merge(fail_val.rename("sum_order_value_otif_fail"), left_on="member", right_index=True, how="left")
-
-        out["sum_order_value"] = out["sum_order_value"].fillna(0.0)
-        out["sum_order_value_otif_fail"] = out["sum_order_value_otif_fail"].fillna(0.0)
-
-        out["otif_fail_rate_value"] = np.where(
-            out["sum_order_value"] != 0,
-            out["sum_order_value_otif_fail"] / out["sum_order_value"],
-            np.nan
-        )
-
-    return out
+    return rate_tables(df, [dim])[dim]
 
 # =============================================================================
 # Plots: Horizontal bar
 # =============================================================================
+METRIC_LABELS = {
+    "tol_violation_rate_cases": "Quantity tolerance violation rate",
+    "late_rate_cases": "Late delivery rate",
+    "otif_fail_rate_cases": "OTIF fail rate",
+    "otif_fail_rate_value": "OTIF fail rate (value-weighted)",
+}
+
 def barh_rate(
     tbl: pd.DataFrame,
     metric: str,
@@ -257,6 +340,8 @@ def barh_rate(
 ) -> None:
     if tbl.empty or metric not in tbl.columns:
         return
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter, MaxNLocator
 
     t = tbl.copy()
     if min_cases is not None:
@@ -280,17 +365,12 @@ def barh_rate(
     set_axis_from_zero(ax, "x", vals, pad=0.10)
 
     # Axis formatting
-    ax.xaxis.set_major_formatter(PCT_FMT)
+    ax.xaxis.set_major_formatter(FuncFormatter(pct))
     ax.xaxis.set_major_locator(MaxNLocator(nbins=6))
     ax.set_xlabel("Share of cases")
     ax.set_ylabel("")
 
-    pretty_metric = {
-        "tol_violation_rate_cases": "Quantity tolerance violation rate",
-        "late_rate_cases": "Late delivery rate",
-        "otif_fail_rate_cases": "OTIF fail rate",
-        "otif_fail_rate_value": "OTIF fail rate (value-weighted)",
-    }.get(metric, metric)
+    pretty_metric = METRIC_LABELS.get(metric, metric)
 
     ax.set_title(f"{dim_label}: {pretty_metric} (Top {top_n}, N≥{min_cases})", color=PAL["teal"])
 
@@ -319,6 +399,8 @@ def scatter_meta(
     """
     if tbl.empty or x_col not in tbl.columns or y_col not in tbl.columns:
         return
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter, MaxNLocator
 
     t = tbl.copy()
     if min_cases is not None and "cases" in t.columns:
@@ -355,8 +437,8 @@ def scatter_meta(
     set_axis_from_zero(ax, "x", x, pad=0.10)
     set_axis_from_zero(ax, "y", y, pad=0.10)
 
-    ax.xaxis.set_major_formatter(PCT_FMT)
-    ax.yaxis.set_major_formatter(PCT_FMT)
+    ax.xaxis.set_major_formatter(FuncFormatter(pct))
+    ax.yaxis.set_major_formatter(FuncFormatter(pct))
     ax.xaxis.set_major_locator(MaxNLocator(nbins=6))
     ax.yaxis.set_major_locator(MaxNLocator(nbins=6))
 
@@ -405,6 +487,71 @@ def scatter_meta(
     style_axes(ax)
     savefig(filename)
 
+# =============================================================================
+# Plots: Trend small multiples (one panel per member, see otif_trend.py)
+# =============================================================================
+def trend_small_multiples(
+    tbl: pd.DataFrame,
+    dim_label: str,
+    filename: str,
+    metric: str = "otif_fail_rate_cases",
+    window: int = 4,
+    top_n: int = 6,
+    min_cases: int = MIN_CASES,
+    ncols: int = 3,
+) -> None:
+    """
+    Per member: the rate per bucket (dots) and over the trailing `window`
+    buckets (line), on a shared 0-based y axis.
+    """
+    roll = f"{metric}_roll{window}"
+    if tbl.empty or metric not in tbl.columns or roll not in tbl.columns:
+        return
+
+    totals = tbl.groupby("member")["cases"].sum()
+    members = totals[totals >= min_cases].sort_values(ascending=False, kind="stable").head(top_n).index
+    if members.empty:
+        return
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+    ncols = min(ncols, len(members))
+    nrows = math.ceil(len(members) / ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(4.4 * ncols, 2.9 * nrows + 0.9),
+                             sharex=True, sharey=True, squeeze=False)
+    t = tbl[tbl["member"].isin(members)]
+
+    for ax, member in zip(axes.flat, members):
+        m = t[t["member"] == member]
+        x = pd.to_datetime(m["bucket"])
+        ax.plot(x, m[metric], linestyle="none", marker="o", markersize=2.6,
+                color=PAL["mint"], label="Per bucket")
+        ax.plot(x, m[roll], color=PAL["teal"], linewidth=1.8, label=f"Trailing {window}")
+        ax.set_title(f"{member} (N={fmt_int(totals[member])})", loc="left", fontsize=11,
+                     fontweight="normal", color=PAL["text"])
+        style_axes(ax)
+    for i, ax in enumerate(axes.flat):
+        if i >= len(members):
+            ax.axis("off")
+        elif i + ncols >= len(members):
+            ax.tick_params(labelbottom=True)  # last panel of its column
+
+    # Shared axes: formatting the first panel formats all of them
+    ax = axes[0, 0]
+    set_axis_from_zero(ax, "y", t[[metric, roll]].to_numpy(), pad=0.08)
+    ax.yaxis.set_major_formatter(FuncFormatter(pct))
+    ax.yaxis.set_major_locator(MaxNLocator(nbins=5))
+    locator = AutoDateLocator(maxticks=5)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    ax.legend(loc="lower left", fontsize=9)
+
+    fig.suptitle(f"{dim_label}: {METRIC_LABELS.get(metric, metric)} over time "
+                 f"(Top {top_n} by cases, N≥{min_cases})",
+                 x=0.01, ha="left", fontsize=15, fontweight="bold", color=PAL["teal"])
+    savefig(filename)
+
 # =============================================================================
 # Conceptual 2x2 (kept, but made more consistent)
 # =============================================================================
@@ -412,6 +559,9 @@ def plot_problem_classes_2x2(
     filename: str = "concept_2x2_problem_classes.png",
     title: str = "Two distinct problem classes require different management responses",
 ) -> None:
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle, FancyArrowPatch
+
     fig = plt.figure(figsize=(12.8, 7.2))
     ax = plt.gca()
     ax.set_xlim(0, 1)
@@ -484,114 +634,558 @@ def plot_problem_classes_2x2(
     savefig(filename)
 
 # =============================================================================
-# Data quality flags (unchanged, but kept)
+# Data quality flags (rules in dq_flags.py)
 # =============================================================================
+def flag_options() -> dict:
+    return {"csvs": FLAG_CSVS, "table": FLAG_TABLE, "project": FLAG_PROJECT}
+
 def export_flags(df: pd.DataFrame) -> None:
-    def safe_sort(d: pd.DataFrame, cols, ascending):
-        cols2 = [c for c in cols if c in d.columns]
-        if not cols2:
-            return d
-        asc2 = ascending[:len(cols2)] if isinstance(ascending, list) else ascending
-        return d.sort_values(cols2, ascending=asc2)
-
-    if "UNIT_PRICE" in df.columns:
-        m = df["UNIT_PRICE"].eq(0)
-        if m.any():
-            out = df.loc[m].copy()
-            out.insert(0, "FLAG_REASON", "UNIT_PRICE==0")
-            out = safe_sort(out, ["ORDER_VALUE", "CASE_KEY"], [False, True])
-            out.to_csv(FLAGS_DIR / "flag_unit_price_zero.csv", index=False)
-
-    if "ORDER_VALUE" in df.columns:
-        m = df["ORDER_VALUE"].eq(0)
-        if m.any():
-            out = df.loc[m].copy()
-            out.insert(0, "FLAG_REASON", "ORDER_VALUE==0")
-            out = safe_sort(out, ["UNIT_PRICE", "CASE_KEY"], [False, True])
-            out.to_csv(FLAGS_DIR / "flag_order_value_zero.csv", index=False)
-
-    if all(c in df.columns for c in ["ORDER_VALUE", "UNIT_PRICE", "DELIVERED_QUANTITY"]):
-        approx = df["UNIT_PRICE"] * df["DELIVERED_QUANTITY"]
-        rel_err = (df["ORDER_VALUE"] - approx).abs() / approx.replace(0, np.nan)
-        m = rel_err.gt(0.10) & rel_err.notna()
-        if m.any():
-            out = df.loc[m].copy()
-            out["VALUE_REL_ERR"] = rel_err.loc[m]
-            out.insert(0, "FLAG_REASON", "VALUE_REL_ERR>0.10")
-            out = safe_sort(out, ["VALUE_REL_ERR", "ORDER_VALUE", "CASE_KEY"], [False, False, True])
-            out.to_csv(FLAGS_DIR / "flag_value_mismatch_relerr_gt_10pct.csv", index=False)
+    dq_flags.export_flags(df, FLAGS_DIR, **flag_options())
+
+def flag_paths() -> tuple[list[Path], list[Path]]:
+    """(files every flag export writes, per-rule CSVs written only for rules with hits)."""
+    always = [dq_flags.flag_table_path(FLAGS_DIR), FLAGS_DIR / dq_flags.FLAG_LEGEND] if FLAG_TABLE else []
+    per_rule = [FLAGS_DIR / r.filename for r in dq_flags.FLAG_RULES] if FLAG_CSVS else []
+    return always, per_rule
 
 # =============================================================================
-# Main
+# Case table (read + clean + KPIs, cached)
 # =============================================================================
-def main() -> None:
-    df = try_read_csv(CSV_PATH)
-
+def clean_cases(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [c.strip().strip('"') for c in df.columns]
     for c in df.columns:
-        if df[c].dtype == "object":
+        if df[c].dtype == "object" and df[c].str.contains(r'^\s|\s$|"', regex=True, na=False).any():
             df[c] = df[c].str.strip().str.strip('"')
+    return df
 
-    df = engineer_kpis(df)
-
-    dim_candidates = [
-        ("DELIVERY_COMPANY", "supplier", "Delivery Company"),
-        ("FACTORY", "factory", "Factory"),
-        ("PRODUCT_TYPE", "product_type", "Product Type"),
-        ("FACTORY_TYPE", "factory_type", "Factory Type"),
-        ("WAREHOUSE_TYPE", "warehouse_type", "Warehouse Type"),
-        ("CUST_MARKET", "cust_market", "Customer Market"),
-        ("CUST_COUNTRY", "cust_country", "Customer Country"),
-    ]
-    dims = [(d, slug, label) for d, slug, label in dim_candidates if d in df.columns]
-
-    all_rows = []
-    for dim, slug, dim_label in dims:
-        tbl = group_table(df, dim)
-        tbl.to_csv(TABLES_DIR / f"rates_{slug}.csv", index=False)
-        all_rows.append(tbl)
-
-        # Bars
-        barh_rate(
-            tbl,
-            metric="tol_violation_rate_cases",
-            dim_label=dim_label,
-            filename=f"top{TOP_N}_{slug}_tol_violation_rate.png",
-        )
-        barh_rate(
-            tbl,
-            metric="late_rate_cases",
-            dim_label=dim_label,
-            filename=f"top{TOP_N}_{slug}_late_rate.png",
-        )
+def prepare_cases(path: Path) -> pd.DataFrame:
+    with stage("try_read_csv") as s:
+        df = try_read_csv(path)
+        s.rows = len(df)
+    with stage("clean_cases", rows=len(df)):
+        df = clean_cases(df)
+    with stage("engineer_kpis", rows=len(df)):
+        df = engineer_kpis(df)
+    with stage("compact_cases", rows=len(df)):
+        compact = case_memory.compact_cases(df)
+    if MEMORY_REPORT:
+        rep = case_memory.memory_report(df, compact)
+        rep.to_csv(OUT_DIR / "memory_report.csv", index=False)
+        total = rep.iloc[-1]
+        print(f"Case table: {total['bytes_before'] / 2**20:,.1f} MiB -> {total['bytes_after'] / 2**20:,.1f} MiB")
+    return compact
+
+def kpi_code_version() -> str:
+    parts = [KPI_VERSION, inspect.getsource(clean_cases), inspect.getsource(prepare_cases),
+             inspect.getsource(engineer_kpis), inspect.getsource(case_memory),
+             inspect.getsource(case_ingest)]
+    return "\n".join(parts)
+
+def load_cases(path: Path, use_cache: bool | None = None, rebuild: bool | None = None) -> pd.DataFrame:
+    """Cleaned, KPI-engineered case table; None = USE_CACHE / REBUILD_CACHE."""
+    use_cache = USE_CACHE if use_cache is None else use_cache
+    rebuild = REBUILD_CACHE if rebuild is None else rebuild
+    with stage("load_cases") as s:
+        if not use_cache:
+            df = prepare_cases(path)
+        else:
+            df = kpi_cache.load_or_build(path, lambda: prepare_cases(path), kpi_code_version(), rebuild=rebuild)
+        s.rows = len(df)
+    return df
 
-        # Meta scatter
-        scatter_meta(
-            tbl,
+# =============================================================================
+# Report (rate tables -> CSVs, ranking, plots)
+# =============================================================================
+def write_rate_table(tbl: pd.DataFrame, slug: str, dim: str, cases: pd.DataFrame | None = None) -> pd.DataFrame:
+    if RATE_CI:
+        tbl = rate_ci.add_intervals(tbl, cases, dim)
+    tbl.to_csv(TABLES_DIR / f"rates_{slug}.csv", index=False)
+    return tbl
+
+def rate_plot_specs(tbl: pd.DataFrame, slug: str, dim_label: str) -> list[PlotSpec]:
+    plots = []
+
+    # Bars
+    for metric, stem in [("tol_violation_rate_cases", "tol_violation_rate"), ("late_rate_cases", "late_rate")]:
+        name = f"top{TOP_N}_{slug}_{stem}.png"
+        plots.append(PlotSpec(name, barh_rate, dict(
+            tbl=tbl,
+            metric=metric,
             dim_label=dim_label,
-            filename=f"meta_scatter_{slug}_late_vs_tol_bubble_value.png",
-            top_n_labels=8,
-            min_cases=MIN_CASES,
-            show_reference_lines=True,
-        )
-
-    # Combined ranking
+            filename=str(PLOTS_DIR / name),
+        )))
+
+    # Meta scatter
+    name = f"meta_scatter_{slug}_late_vs_tol_bubble_value.png"
+    plots.append(PlotSpec(name, scatter_meta, dict(
+        tbl=tbl,
+        dim_label=dim_label,
+        filename=str(PLOTS_DIR / name),
+        top_n_labels=8,
+        min_cases=MIN_CASES,
+        show_reference_lines=True,
+    )))
+    return plots
+
+def concept_plot_spec() -> PlotSpec:
+    name = "concept_2x2_problem_classes.png"
+    return PlotSpec(name, plot_problem_classes_2x2, dict(filename=str(PLOTS_DIR / name)))
+
+def trend_path(slug: str) -> Path:
+    return TABLES_DIR / f"trend_{slug}_{TREND_FREQ}.csv"
+
+def write_trends(df: pd.DataFrame, dims: list[tuple[str, str, str]]) -> dict[str, pd.DataFrame]:
+    with stage("trend_tables", rows=len(df)):
+        tables = otif_trend.trend_tables(df, [d for d, _, _ in dims], TREND_DATE, TREND_FREQ, TREND_WINDOWS)
+    for dim, slug, _ in dims:
+        if dim in tables:
+            tables[dim].to_csv(trend_path(slug), index=False)
+    return tables
+
+def trend_plot_spec(tbl: pd.DataFrame, slug: str, dim_label: str) -> PlotSpec:
+    name = f"trend_{slug}_{TREND_FREQ}_otif_fail_rate.png"
+    return PlotSpec(name, trend_small_multiples, dict(
+        tbl=tbl,
+        dim_label=dim_label,
+        filename=str(PLOTS_DIR / name),
+        window=TREND_WINDOWS[0],
+        top_n=TREND_TOP_N,
+    ))
+
+def write_ranking(all_rows: list[pd.DataFrame]) -> None:
     if all_rows:
         otif_all = pd.concat(all_rows, ignore_index=True)
+        rank_col = "otif_fail_rate_cases_wilson_lo" if RATE_CI and RANK_BY_LOWER_BOUND else "otif_fail_rate_cases"
         otif_all = otif_all.sort_values(
-            ["otif_fail_rate_cases", "cases"],
+            [rank_col, "cases"],
             ascending=[False, False],
             na_position="last",
         )
         otif_all.to_csv(OUT_DIR / "otif_ranking_all_dimensions.csv", index=False)
 
-    export_flags(df)
+def render(plots: list[PlotSpec]) -> dict[str, str]:
+    # Plots are rendered in parallel (see plot_render.py)
+    with stage("render_plots", rows=len(plots)):
+        failed = render_plots(plots, workers=PLOT_WORKERS, style=apply_slide_style)
+    for name, err in failed.items():
+        print(f"Plot failed: {name}\n{err}")
+    return failed
+
+def write_report(
+    tables: dict[str, pd.DataFrame],
+    dims: list[tuple[str, str, str]],
+    cases: pd.DataFrame | None = None,
+) -> None:
+    """`cases` (the case table) adds value-weighted rate intervals."""
+    all_rows = []
+    plots = []
+    for dim, slug, dim_label in dims:
+        with stage("rate_table", rows=len(tables[dim]), dimension=dim):
+            tbl = write_rate_table(tables[dim], slug, dim, cases)
+        all_rows.append(tbl)
+        plots.extend(rate_plot_specs(tbl, slug, dim_label))
+    plots.append(concept_plot_spec())
+
+    # Combined ranking
+    if "tables" in OUTPUTS:
+        with stage("ranking"):
+            write_ranking(all_rows)
+
+    if "plots" in OUTPUTS:
+        render(plots)
+
+# =============================================================================
+# Stage DAG (full runs; see stage_dag.py)
+# =============================================================================
+PLOT_CODE = [barh_rate, scatter_meta, plot_problem_classes_2x2, apply_slide_style, savefig,
+             style_axes, set_axis_from_zero, pct, fmt_int, rate_plot_specs, concept_plot_spec, METRIC_LABELS]
+
+def case_columns(path: Path) -> list[str]:
+    """Header of the case table, cleaned like clean_cases (no data read)."""
+    sep = case_ingest.sniff_delimiter(path)
+    return [c.strip().strip('"') for c in pd.read_csv(path, sep=sep, nrows=0).columns]
+
+def _rates_node(dim: str, slug: str) -> Node:
+    def rates(cube: otif_cube.OtifCube, df: pd.DataFrame) -> pd.DataFrame:
+        return write_rate_table(otif_cube.cube_rates(cube, [dim]), slug, dim, df)
+    return Node(f"rates:{dim}", rates, ["cube", "cases"],
+                params={"dim": dim, "slug": slug, "rate_ci": RATE_CI},
+                code=[write_rate_table, rate_ci, otif_cube],
+                outputs=[TABLES_DIR / f"rates_{slug}.csv"])
+
+def plot_params(spec: PlotSpec) -> dict:
+    """
+    Every argument the plot function runs with (its keyword defaults, such as
+    TOP_N / MIN_CASES, overridden by the spec's own), minus the table, plus PAL.
+    """
+    params = {k: p.default for k, p in inspect.signature(spec.fn).parameters.items()
+              if p.default is not inspect.Parameter.empty}
+    params.update(spec.kwargs)
+    params.pop("tbl", None)
+    return {**params, "pal": PAL}
+
+def _plot_node(dim: str, slug: str, dim_label: str, spec: PlotSpec) -> Node:
+    name = spec.name
+
+    def plot(tbl: pd.DataFrame) -> PlotSpec:
+        return next(p for p in rate_plot_specs(tbl, slug, dim_label) if p.name == name)
+
+    return Node(f"plot:{name}", plot, [f"rates:{dim}"], params=plot_params(spec),
+                code=PLOT_CODE, outputs=[PLOTS_DIR / name], batch=True)
+
+def _trend_nodes(dims: list[tuple[str, str, str]]) -> list[Node]:
+    """Trend tables (one node, one grouped pass) and, with plots, one plot node per dimension."""
+    nodes = [Node("trend", lambda df: write_trends(df, dims), ["cases"],
+                  params={"dims": dims, "date": TREND_DATE, "freq": TREND_FREQ, "windows": TREND_WINDOWS},
+                  code=[write_trends, otif_trend, otif_agg],
+                  outputs=[trend_path(slug) for _, slug, _ in dims])]
+    if "plots" not in OUTPUTS:
+        return nodes
+    for dim, slug, dim_label in dims:
+        spec = trend_plot_spec(pd.DataFrame(), slug, dim_label)
+
+        def plot(tables: dict[str, pd.DataFrame], dim=dim, slug=slug, dim_label=dim_label) -> PlotSpec:
+            return trend_plot_spec(tables[dim], slug, dim_label)
+
+        nodes.append(Node(f"plot:{spec.name}", plot, ["trend"], params=plot_params(spec),
+                          code=PLOT_CODE + [trend_small_multiples, trend_plot_spec],
+                          outputs=[PLOTS_DIR / spec.name], batch=True))
+    return nodes
+
+def gaps_path() -> Path:
+    return TABLES_DIR / "execution_gaps.csv"
+
+def write_gaps(log: event_log.EventLog, ev: event_log.SortedEvents) -> pd.DataFrame:
+    """Execution gap flags per case (CASE_KEY x rule) -> gaps_path()."""
+    gaps = execution_gaps.gap_matrix(log, ev=ev)
+    gaps.to_csv(gaps_path())
+    return gaps
+
+def tpt_paths() -> list[Path]:
+    return [TABLES_DIR / "tpt_by_dimension.csv", TABLES_DIR / "tpt_happy_path_delta.csv"]
+
+def write_tpt(
+    df: pd.DataFrame,
+    log: event_log.EventLog,
+    ev: event_log.SortedEvents,
+    v: variants.Variants,
+    dims: list[str],
+) -> pd.DataFrame:
+    """TPT quantiles per dimension member, happy path vs deviating, and their median delta -> tpt_paths()."""
+    durations = tpt.case_tpt(log, ev=ev)
+    summary = tpt.tpt_by_dimension(df, durations, dims, tpt.happy_path_cases(log, v))
+    by_dim, delta = tpt_paths()
+    summary.to_csv(by_dim, index=False)
+    (tpt.happy_path_delta(summary) if len(summary) else pd.DataFrame()).to_csv(delta, index=False)
+    return summary
+
+def dfg_paths() -> list[Path]:
+    return [dfg.dfg_path(TABLES_DIR / "dfg"), TABLES_DIR / f"dfg_top{DFG_TOP_K}.csv"]
+
+def write_dfg(df: pd.DataFrame, log: event_log.EventLog, ev: event_log.SortedEvents, dims: list[str]) -> pd.DataFrame:
+    """Sparse DFG edges of the whole log and of every dimension member -> dfg_paths()."""
+    edges = dfg.build_dfg(log, df, dims, ev=ev)
+    full, top = dfg_paths()
+    dfg.export_dfg(edges, full)
+    dfg.top_k_edges(edges, DFG_TOP_K).to_csv(top, index=False)
+    return edges
+
+def _process_nodes(dims: list[str]) -> list[Node]:
+    """Event log (value nodes, read and sorted once) and the process analyses built on it."""
+    return [
+        Node("events", lambda: event_log.read_event_log(ACTIVITY_PATH), code=[event_log], inputs=[ACTIVITY_PATH]),
+        Node("sorted_events", event_log.sort_events, ["events"], code=[event_log]),
+        Node("variants", lambda log, ev: variants.compute_variants(log, ev=ev), ["events", "sorted_events"],
+             params=variants.HAPPY_PATH, code=[variants]),
+        Node("gaps", write_gaps, ["events", "sorted_events"], params=execution_gaps.GAP_RULES,
+             code=[write_gaps, execution_gaps], outputs=[gaps_path()]),
+        Node("tpt", lambda df, log, ev, v: write_tpt(df, log, ev, v, dims),
+             ["cases", "events", "sorted_events", "variants"],
+             params={"dims": dims, "pairs": tpt.TPT_PAIRS, "quantiles": tpt.QUANTILES, "alpha": tpt.ALPHA},
+             code=[write_tpt, tpt], outputs=tpt_paths()),
+        Node("dfg", lambda df, log, ev: write_dfg(df, log, ev, dims), ["cases", "events", "sorted_events"],
+             params={"dims": dims, "top_k": DFG_TOP_K}, code=[write_dfg, dfg], outputs=dfg_paths()),
+    ]
+
+def build_stage_dag(path: Path) -> list[Node]:
+    """
+    Full run as stages: case table -> cube -> rates -> plots / ranking, flags,
+    and the event log -> process analyses (with ACTIVITY_PATH). Only the
+    stages of the selected OUTPUTS are built.
+    """
+    columns = set(case_columns(path))
+    dims = [(d, slug, label) for d, slug, label in dim_candidates() if d in columns]
+    dim_names = [d for d, _, _ in dims]
+    slugs = {d: slug for d, slug, _ in dims}
+    pair_tables = [TABLES_DIR / f"rates_{slugs[a]}_x_{slugs[b]}.csv" for a, b in CUBE_DIM_PAIRS
+                   if a in slugs and b in slugs]
+
+    nodes = [
+        Node("cases", lambda: load_cases(path), params={"kpi_version": KPI_VERSION},
+             code=[load_cases, prepare_cases, clean_cases, engineer_kpis, case_memory, case_ingest], inputs=[path]),
+        Node("cube", lambda df: otif_cube.build_cube(df, dim_names), ["cases"],
+             params=dim_names, code=[otif_cube]),
+    ]
+    if "flags" in OUTPUTS:
+        always, per_rule = flag_paths()
+        nodes.append(Node("flags", export_flags, ["cases"], params=flag_options(), code=[dq_flags],
+                          outputs=always, optional=per_rule))
+    if OUTPUTS & {"tables", "plots"}:
+        nodes += [_rates_node(dim, slug) for dim, slug, _ in dims]
+    if "plots" in OUTPUTS:
+        for dim, slug, dim_label in dims:
+            nodes += [_plot_node(dim, slug, dim_label, p) for p in rate_plot_specs(pd.DataFrame(), slug, dim_label)]
+        concept = concept_plot_spec()
+        nodes.append(Node("plot:concept", concept_plot_spec, params=plot_params(concept), code=PLOT_CODE,
+                          outputs=[PLOTS_DIR / concept.name], batch=True))
+    if TREND and TREND_DATE in columns and OUTPUTS & {"tables", "plots"}:
+        nodes += _trend_nodes(dims)
+    if "tables" not in OUTPUTS:
+        return nodes
+
+    rates = [f"rates:{d}" for d in dim_names]
+    nodes += [
+        Node("cube_tables", lambda cube: write_cube_tables(cube, CUBE_DIM_PAIRS), ["cube"],
+             params={"pairs": CUBE_DIM_PAIRS, "rate_ci": RATE_CI}, code=[write_cube_tables, rate_ci],
+             outputs=pair_tables),
+        Node("ranking", lambda *tbls: write_ranking(list(tbls)), rates,
+             params={"rank_by_lower_bound": RANK_BY_LOWER_BOUND, "rate_ci": RATE_CI},
+             code=[write_ranking], outputs=[OUT_DIR / "otif_ranking_all_dimensions.csv"]),
+    ]
+    if SUBGROUP_DISCOVERY:
+        nodes.append(Node("subgroups", lambda df: write_subgroups(df, dim_names), ["cases"],
+                          params={"min_cases": MIN_CASES}, code=[write_subgroups, subgroups, otif_query],
+                          outputs=[OUT_DIR / "otif_subgroups_ranking.csv"]))
+    if ACTIVITY_PATH is not None and Path(ACTIVITY_PATH).exists():
+        nodes += _process_nodes(dim_names)
+    return nodes
+
+def render_stage_plots(jobs: dict[str, PlotSpec]) -> dict[str, str]:
+    """Batch runner: render the stale plot stages on the process pool."""
+    return render([spec._replace(name=node) for node, spec in jobs.items()])
+
+# =============================================================================
+# Run configuration (module constants, overridden by the CLI)
+# =============================================================================
+def dim_candidates() -> list[tuple[str, str, str]]:
+    """DIM_CANDIDATES restricted to DIMENSIONS (column names or slugs)."""
+    if DIMENSIONS is None:
+        return DIM_CANDIDATES
+    wanted = set(DIMENSIONS)
+    return [t for t in DIM_CANDIDATES if t[0] in wanted or t[1] in wanted]
+
+def set_out_dir(out_dir: Path) -> None:
+    global OUT_DIR, PLOTS_DIR, TABLES_DIR, FLAGS_DIR
+    OUT_DIR = Path(out_dir).resolve()  # plot specs carry absolute file names (see savefig)
+    PLOTS_DIR, TABLES_DIR, FLAGS_DIR = OUT_DIR / "plots", OUT_DIR / "tables", OUT_DIR / "flags"
+
+def run_dir() -> Path:
+    """Folder a run writes to: OUT_DIR, or OUT_DIR/preview for a preview."""
+    return OUT_DIR / "preview" if PREVIEW else OUT_DIR
+
+def make_out_dirs() -> None:
+    """Create the output folders of the selected OUTPUTS (not at import)."""
+    if PREVIEW:  # writes run_dir() only
+        run_dir().mkdir(parents=True, exist_ok=True)
+        return
+    dirs = [OUT_DIR]
+    if OUTPUTS & {"tables", "plots"}:
+        dirs.append(TABLES_DIR)
+    if "plots" in OUTPUTS:
+        dirs.append(PLOTS_DIR)
+    if "flags" in OUTPUTS:
+        dirs.append(FLAGS_DIR)
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="OTIF root cause tables, plots and data quality flags for the Woodcorp case table.",
+    )
+    p.add_argument("csv", nargs="?", type=Path, default=CSV_PATH, help="case table CSV (default: %(default)s)")
+    p.add_argument("-o", "--out-dir", type=Path, default=OUT_DIR, help="run folder (default: %(default)s)")
+    p.add_argument("--dims", nargs="+", metavar="DIM",
+                   help="dimensions to report, by column or slug: "
+                        + ", ".join(slug for _, slug, _ in DIM_CANDIDATES))
+    out = p.add_argument_group("outputs (default: all)")
+    out.add_argument("--tables-only", action="store_true", help="rate tables, cube tables and ranking")
+    out.add_argument("--plots", action="store_true", help="plots (and the rate tables they are drawn from)")
+    out.add_argument("--flags", action="store_true", help="data quality flags")
+    p.add_argument("--ci", action="store_true", default=RATE_CI,
+                   help="add Wilson and bootstrap confidence intervals to the rate tables")
+    p.add_argument("--activities", type=Path, default=ACTIVITY_PATH,
+                   help="activity table for the process analyses (default: %(default)s)")
+    p.add_argument("--trend", choices=list(otif_trend.FREQS), help="trend tables and plots per week or month")
+    p.add_argument("--trend-date", choices=["PROMISED_DATE", "DELIVERED_DATE"], default=TREND_DATE,
+                   help="date the trend buckets are based on (default: %(default)s)")
+    p.add_argument("--preview", nargs="?", type=float, const=PREVIEW_FRACTION, metavar="FRACTION",
+                   help="rate tables and ranking from a stratified sample -> OUT_DIR/preview "
+                        f"(default fraction: {PREVIEW_FRACTION})")
+    p.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="stream the table in chunks of N rows")
+    p.add_argument("--incremental", action="store_true", default=INCREMENTAL,
+                   help="fold the CSV as a new batch into the run folder's stored state")
+    p.add_argument("--workers", type=int, default=PLOT_WORKERS, help="plot render processes")
+    p.add_argument("--force", action="store_true", help="rebuild every artifact, even if up to date")
+    p.add_argument("--rebuild-cache", action="store_true", help="rebuild the KPI cache")
+    args = p.parse_args(argv)
+
+    if args.tables_only and (args.plots or args.flags):
+        p.error("--tables-only cannot be combined with --plots or --flags")
+    known = {d for t in DIM_CANDIDATES for d in t[:2]}
+    unknown = [d for d in args.dims or [] if d not in known]
+    if unknown:
+        p.error(f"unknown dimension(s): {', '.join(unknown)}")
+    return args
+
+def configure(args: argparse.Namespace) -> None:
+    """Apply parsed CLI arguments to the module constants."""
+    global CSV_PATH, OUTPUTS, DIMENSIONS, CHUNK_ROWS, INCREMENTAL, PLOT_WORKERS, SKIP_UP_TO_DATE, REBUILD_CACHE
+    global TREND, TREND_FREQ, TREND_DATE, PREVIEW, PREVIEW_FRACTION, RATE_CI, ACTIVITY_PATH
+    CSV_PATH = args.csv
+    set_out_dir(args.out_dir)
+    if args.tables_only:
+        OUTPUTS = {"tables"}
+    elif args.plots or args.flags:
+        OUTPUTS = {o for o, on in [("plots", args.plots), ("flags", args.flags)] if on}
+    if args.dims:
+        DIMENSIONS = args.dims
+    RATE_CI = args.ci
+    ACTIVITY_PATH = args.activities
+    if args.trend:
+        TREND, TREND_FREQ = True, args.trend
+    TREND_DATE = args.trend_date
+    if args.preview is not None:
+        PREVIEW, PREVIEW_FRACTION = True, args.preview
+    CHUNK_ROWS = args.chunk_rows
+    INCREMENTAL = args.incremental
+    PLOT_WORKERS = args.workers
+    SKIP_UP_TO_DATE = SKIP_UP_TO_DATE and not args.force
+    REBUILD_CACHE = REBUILD_CACHE or args.rebuild_cache
+
+# =============================================================================
+# Main
+# =============================================================================
+def write_cube_tables(cube: otif_cube.OtifCube, pairs: list[tuple[str, str]]) -> None:
+    slugs = {d: slug for d, slug, _ in DIM_CANDIDATES}
+    for pair in pairs:
+        if all(d in cube.dims for d in pair):
+            with stage("cube_table", dimension=otif_cube.DIM_SEP.join(pair)) as s:
+                tbl = otif_cube.cube_rates(cube, list(pair))
+                if RATE_CI:
+                    tbl = rate_ci.add_intervals(tbl)
+                tbl.to_csv(TABLES_DIR / f"rates_{'_x_'.join(slugs[d] for d in pair)}.csv", index=False)
+                s.rows = len(tbl)
+
+def write_subgroups(df: pd.DataFrame, dims: list[str]) -> None:
+    with stage("build_index", rows=len(df)):
+        index = otif_query.build_index(df, dims)
+    segments = subgroups.discover_subgroups(index, MIN_CASES)
+    segments.to_csv(OUT_DIR / "otif_subgroups_ranking.csv", index=False)
+
+def run_incremental(batch_path: Path) -> None:
+    batch = load_cases(batch_path)
+    dims = [(d, slug, label) for d, slug, label in dim_candidates() if d in batch.columns]
+    dim_names = [d for d, _, _ in dims]
+
+    with stage("fold_batch", rows=len(batch)):
+        state_dir = otif_incremental.state_dir(OUT_DIR)
+        state = otif_incremental.load_state(state_dir)
+        state = otif_incremental.fold_batch(state, batch, dim_names)
+        otif_incremental.save_state(state, state_dir)
+
+    if OUTPUTS & {"tables", "plots"}:
+        with stage("report"):
+            write_report(otif_incremental.state_tables(state, dim_names), dims)
+    print(f"Folded {len(batch):,} cases; state holds {len(state.ledger):,} cases.")
+    print("Flags and trends are only written by a full run.")
+
+def run_chunked(path: Path, chunk_rows: int) -> None:
+    def prepare(chunk: pd.DataFrame) -> pd.DataFrame:
+        with stage("prepare_chunk", rows=len(chunk)):
+            return engineer_kpis(clean_cases(chunk))
+
+    chunks = case_ingest.iter_case_table(path, chunk_rows=chunk_rows)
+    dims = dim_candidates()
+    flags_dir = FLAGS_DIR if "flags" in OUTPUTS else None
+    with stage("run_chunked") as s:
+        tables, n_cases = otif_chunked.run_chunked(chunks, prepare, [d for d, _, _ in dims], flags_dir, flag_options())
+        s.rows = n_cases
+
+    if OUTPUTS & {"tables", "plots"}:
+        with stage("report"):
+            write_report(tables, [t for t in dims if t[0] in tables])
+    print(f"Streamed {n_cases:,} cases in chunks of {chunk_rows:,}.")
+    if TREND:
+        print("Trends are only written by a full run.")
+
+def run_preview(path: Path) -> None:
+    dims = dim_candidates()
+    sampler = otif_preview.StratifiedSampler([d for d, _, _ in dims], PREVIEW_FRACTION, PREVIEW_MIN_PER_MEMBER)
+    columns = [d for d, _, _ in dims] + PREVIEW_COLUMNS
+    with stage("sample") as s:
+        # raw text chunks of the needed columns; only the sample gets typed
+        for chunk in case_ingest.iter_case_table(path, chunk_rows=CHUNK_ROWS or 250_000,
+                                                 columns=columns, typed=False):
+            sampler.add(chunk)
+        sample = sampler.sample()
+        s.rows = len(sample)
+    with stage("prepare_sample", rows=len(sample)):
+        sample = engineer_kpis(clean_cases(case_ingest.apply_schema(sample)))
+
+    preview_dir = run_dir()
+    preview_dir.mkdir(parents=True, exist_ok=True)
+    all_rows = []
+    for dim, slug, _ in dims:
+        if dim in sample.columns:
+            with stage("preview_table", dimension=dim):
+                tbl = otif_preview.preview_table(sample, dim)
+            tbl.to_csv(preview_dir / f"rates_{slug}.csv", index=False)
+            all_rows.append(tbl)
+    if all_rows:
+        ranking = pd.concat(all_rows, ignore_index=True).sort_values(
+            ["otif_fail_rate_cases", "cases"], ascending=[False, False], na_position="last")
+        ranking.to_csv(preview_dir / "otif_ranking_all_dimensions.csv", index=False)
+        print(f"Preview from {len(sample):,} of {sampler.n_cases:,} cases; "
+              f"{int(ranking['rank_uncertain'].sum())} of {len(ranking)} members have an uncertain rank.")
+
+def run_full(path: Path) -> None:
+    nodes = build_stage_dag(path)
+    values = run_dag(nodes, OUT_DIR / ".stage_manifest.json", workers=PLOT_WORKERS,
+                     batch_runner=render_stage_plots, force=not SKIP_UP_TO_DATE)
+
+    if QUERY_PORT:
+        df = values["cases"] if "cases" in values else load_cases(path)
+        with stage("build_index", rows=len(df)):
+            index = otif_query.build_index(df, [d for d, _, _ in dim_candidates() if d in df.columns])
+        otif_query.serve(index, port=QUERY_PORT)
+
+def run() -> None:
+    if PREVIEW:
+        run_preview(CSV_PATH)
+    elif INCREMENTAL:
+        run_incremental(CSV_PATH)
+    elif CHUNK_ROWS:
+        run_chunked(CSV_PATH, CHUNK_ROWS)
+    else:
+        run_full(CSV_PATH)
 
-    plot_problem_classes_2x2("concept_2x2_problem_classes.png")
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point (argv=None reads sys.argv). Arguments default to
+    the module constants; see `python 02c_explore.py --help`.
+    """
+    configure(parse_args(argv))
+    make_out_dirs()
+    if RUN_REPORT:
+        meta = {"csv_path": str(CSV_PATH), "incremental": INCREMENTAL, "chunk_rows": CHUNK_ROWS, "preview": PREVIEW,
+                "outputs": sorted(OUTPUTS), "dimensions": DIMENSIONS}
+        with run_report.recording(run_dir() / "run_report.json", PROFILE_STAGES, TRACE_MEMORY, meta):
+            run()
+    else:
+        run()
 
     print("Done:")
-    print("Assets root:", ASSETS_DIR.resolve())
-    print("Run folder:", OUT_DIR.resolve())
+    print("Run folder:", run_dir())
 
 if __name__ == "__main__":
     main()
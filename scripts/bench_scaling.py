@@ -0,0 +1,186 @@
+"""
+Purpose
+Scaling benchmark for 02c_explore.py on synthetic data (see synth_data.py).
+
+For every size in SIZES, a case table is generated once (kept under
+BENCH_DIR/data) and the pipeline stages are timed in a fresh subprocess, so
+the peak RSS of one size does not leak into the next: ingest
+(try_read_csv), clean_cases, engineer_kpis, group_table over DIM_CANDIDATES,
+the report (rates CSVs, ranking, plots) and export_flags. Sizes from
+CHUNKED_FROM on run the chunked pipeline instead (see otif_chunked.py);
+there ingest, cleaning/KPIs and aggregation/flags are summed over chunks.
+
+Results (seconds, rows/s, peak RSS per stage) go to BENCH_DIR/bench_results.csv.
+If a previous results file exists, stages that got slower than
+REGRESSION_TOLERANCE (and REGRESSION_MIN_SECONDS) are reported and the exit code is 1.
+
+Notes
+Peak RSS comes from resource.getrusage (not available on Windows; the column
+is then empty). Plot rendering uses PLOT_WORKERS of 02c_explore.py.
+
+Usage: python bench_scaling.py [N_CASES ...]
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import synth_data
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BENCH_DIR = SCRIPTS_DIR.parent / "data" / ".bench"
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]  # <- adjust if needed
+CHUNKED_FROM = 10_000_000
+CHUNK_ROWS = 1_000_000
+REGRESSION_TOLERANCE = 0.25  # slower by more than 25% -> regression
+REGRESSION_MIN_SECONDS = 0.5  # ... and by more than this (timer noise on tiny stages)
+
+RESULT_COLUMNS = ["cases", "mode", "stage", "seconds", "rows_per_s", "peak_rss_mb"]
+
+# =============================================================================
+# Measurement (runs in the child process)
+# =============================================================================
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10  # bytes on macOS, KiB on Linux
+
+def _load_explore(out_dir: Path):
+    spec = importlib.util.spec_from_file_location("explore", SCRIPTS_DIR / "02c_explore.py")
+    m = importlib.util.module_from_spec(spec)
+    sys.modules["explore"] = m
+    spec.loader.exec_module(m)
+    m.OUT_DIR, m.PLOTS_DIR, m.TABLES_DIR, m.FLAGS_DIR = out_dir, out_dir / "plots", out_dir / "tables", out_dir / "flags"
+    for d in (m.PLOTS_DIR, m.TABLES_DIR, m.FLAGS_DIR):
+        d.mkdir(parents=True, exist_ok=True)
+    return m
+
+class _Stages:
+    def __init__(self, n: int, mode: str):
+        self.n, self.mode, self.rows, self.totals = n, mode, [], {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+    def close(self, stage: str) -> None:
+        s = self.totals.pop(stage)
+        self.rows.append({"cases": self.n, "mode": self.mode, "stage": stage, "seconds": s,
+                          "rows_per_s": self.n / s if s > 0 else None, "peak_rss_mb": peak_rss_mb()})
+
+    def timed(self, stage: str, fn, *args):
+        t = time.perf_counter()
+        out = fn(*args)
+        self.add(stage, time.perf_counter() - t)
+        self.close(stage)
+        return out
+
+def run_stages(case_path: Path, n: int, chunked: bool) -> list[dict]:
+    """Time the pipeline stages on one case table; one row per stage."""
+    out_dir = Path(tempfile.mkdtemp(prefix="bench_out_"))
+    m = _load_explore(out_dir)
+    st = _Stages(n, "chunked" if chunked else "in_memory")
+
+    if not chunked:
+        df = st.timed("ingest", m.try_read_csv, case_path)
+        df = st.timed("clean_cases", m.clean_cases, df)
+        df = st.timed("engineer_kpis", m.engineer_kpis, df)
+        dims = [t for t in m.DIM_CANDIDATES if t[0] in df.columns]
+        tables = st.timed("group_table", lambda: {d: m.group_table(df, d) for d, _, _ in dims})
+        st.timed("report", m.write_report, tables, dims, df)
+        st.timed("export_flags", m.export_flags, df)
+    else:
+        def chunks():
+            it = m.case_ingest.iter_case_table(case_path, chunk_rows=CHUNK_ROWS)
+            while True:
+                t = time.perf_counter()
+                chunk = next(it, None)
+                st.add("ingest", time.perf_counter() - t)
+                if chunk is None:
+                    return
+                yield chunk
+
+        def prepare(chunk):
+            t = time.perf_counter()
+            out = m.engineer_kpis(m.clean_cases(chunk))
+            st.add("clean_kpis", time.perf_counter() - t)
+            return out
+
+        dim_names = [d for d, _, _ in m.DIM_CANDIDATES]
+        t = time.perf_counter()
+        tables, _ = m.otif_chunked.run_chunked(chunks(), prepare, dim_names, m.FLAGS_DIR)
+        total = time.perf_counter() - t
+        st.add("aggregate_flags", total - st.totals["ingest"] - st.totals["clean_kpis"])
+        for stage in ("ingest", "clean_kpis", "aggregate_flags"):
+            st.close(stage)
+        st.timed("report", m.write_report, tables, [t for t in m.DIM_CANDIDATES if t[0] in tables])
+    return st.rows
+
+# =============================================================================
+# Harness
+# =============================================================================
+def ensure_data(n: int) -> Path:
+    data_dir = BENCH_DIR / "data" / f"cases_{n}"
+    path = data_dir / "case.csv"
+    if not path.exists():
+        print(f"Generating {n:,} cases ...")
+        synth_data.write_tables(n, data_dir, activities=False)
+    return path
+
+def bench(sizes: list[int]) -> pd.DataFrame:
+    rows = []
+    for n in sizes:
+        path = ensure_data(n)
+        chunked = n >= CHUNKED_FROM
+        print(f"Benchmarking {n:,} cases ({'chunked' if chunked else 'in memory'}) ...")
+        proc = subprocess.run([sys.executable, __file__, "--child", str(path), str(n), str(int(chunked))],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            continue
+        rows.extend(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+def regressions(new: pd.DataFrame, old: pd.DataFrame, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """Stages of `new` slower than in `old` by more than `tolerance`."""
+    keys = ["cases", "mode", "stage"]
+    both = new.merge(old[keys + ["seconds"]], on=keys, suffixes=("", "_before"))
+    both["slowdown"] = both["seconds"] / both["seconds_before"] - 1
+    slower = both["seconds"] - both["seconds_before"] > REGRESSION_MIN_SECONDS
+    return both[(both["slowdown"] > tolerance) & slower]
+
+def main(sizes: list[int]) -> int:
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    results_path = BENCH_DIR / "bench_results.csv"
+    old = pd.read_csv(results_path) if results_path.exists() else None
+
+    new = bench(sizes)
+    with pd.option_context("display.width", 120, "display.float_format", "{:,.2f}".format):
+        print(new.to_string(index=False))
+
+    if old is not None:
+        slow = regressions(new, old)
+        if len(slow):
+            print("Regressions:")
+            print(slow[["cases", "mode", "stage", "seconds_before", "seconds", "slowdown"]].to_string(index=False))
+        keep = old.merge(new[["cases", "mode"]].drop_duplicates(), how="left", indicator=True)
+        new = pd.concat([old[keep["_merge"].eq("left_only").to_numpy()], new], ignore_index=True)
+    new.sort_values(["cases", "mode"], kind="stable").to_csv(results_path, index=False)
+    print("Results:", results_path)
+    return 1 if old is not None and len(slow) else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_stages(Path(sys.argv[2]), int(sys.argv[3]), sys.argv[4] == "1")))
+    else:
+        sys.exit(main([int(a) for a in sys.argv[1:]] or SIZES))
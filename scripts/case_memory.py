@@ -0,0 +1,124 @@
+"""
+Purpose
+Compact in-memory representation of the KPI-engineered case table.
+
+case_ingest already types the known columns (categoricals, Int64, floats).
+compact_cases narrows what is left:
+- integer columns (IDs, day deltas, 0/1 flags) to the smallest int that holds
+  their range (nullable Int8/16/32 where values are missing),
+- FLOAT32_COLUMNS (quantities, tolerances, day deltas) to float32 when every
+  value survives the round trip exactly, so results do not change,
+- repeated text (CUST_NAME, ...) to categoricals.
+Money columns stay float64, since products like UNIT_PRICE * quantity would
+otherwise be computed in float32. The IS_* flags stay numpy bool (1 byte);
+otif_query packs them to bits where it pays off.
+
+TOL_LOWER / TOL_UPPER are not stored: tol_bounds computes them from the
+order quantity and tolerances when needed (flag exports add them to the
+flagged rows only).
+
+Notes
+memory_report lists the footprint per column before and after compaction,
+with derived on-demand columns counted at their float64 size before.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+FLOAT32_COLUMNS = [
+    "ORDERED_QUANTITY", "DELIVERED_QUANTITY",
+    "MIN_ORDER_TOLERANCE", "MAX_ORDER_TOLERANCE",
+    "DELTA_DAYS", "OUTSIDE_TOL_QTY",
+]
+CATEGORY_MAX_RATIO = 0.5  # text -> category if distinct values <= ratio * rows
+
+TOL_COLUMNS = ["TOL_LOWER", "TOL_UPPER"]
+TOL_BEFORE = "IS_TOL_VIOLATION"  # on-demand columns are inserted before this one
+
+_INT_STEPS = [(np.int8, "Int8"), (np.int16, "Int16"), (np.int32, "Int32")]
+
+# =============================================================================
+# Derived columns
+# =============================================================================
+def tol_bounds(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """Delivered quantity bounds: ORDERED_QUANTITY * (1 + tolerance / 100)."""
+    qty = df["ORDERED_QUANTITY"].astype(float)
+    tmin = df.get("MIN_ORDER_TOLERANCE", pd.Series(np.nan, index=df.index)).astype(float).fillna(0.0)
+    tmax = df.get("MAX_ORDER_TOLERANCE", pd.Series(np.nan, index=df.index)).astype(float).fillna(0.0)
+    return qty * (1.0 + tmin / 100.0), qty * (1.0 + tmax / 100.0)
+
+def with_tol_bounds(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` plus TOL_LOWER / TOL_UPPER (before IS_TOL_VIOLATION) if missing."""
+    if "ORDERED_QUANTITY" not in df.columns or all(c in df.columns for c in TOL_COLUMNS):
+        return df
+    lower, upper = tol_bounds(df)
+    out = df.copy()
+    at = out.columns.get_loc(TOL_BEFORE) if TOL_BEFORE in out.columns else len(out.columns)
+    out.insert(at, "TOL_LOWER", lower)
+    out.insert(at + 1, "TOL_UPPER", upper)
+    return out
+
+# =============================================================================
+# Compaction
+# =============================================================================
+def _narrow_int(s: pd.Series) -> pd.Series:
+    nullable = isinstance(s.dtype, pd.api.extensions.ExtensionDtype)
+    if s.isna().all():
+        return s
+    lo, hi = s.min(), s.max()
+    for np_type, ext in _INT_STEPS:
+        info = np.iinfo(np_type)
+        if info.min <= lo and hi <= info.max:
+            return s.astype(ext if nullable else np_type)
+    return s
+
+def _narrow_float(s: pd.Series) -> pd.Series:
+    v = s.to_numpy(dtype=np.float64)
+    f = v.astype(np.float32)
+    return s.astype(np.float32) if np.array_equal(f.astype(np.float64), v, equal_nan=True) else s
+
+def compact_cases(df: pd.DataFrame) -> pd.DataFrame:
+    """Narrowed copy of a KPI-engineered case table (values unchanged)."""
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype):
+            out[c] = s
+        elif pd.api.types.is_integer_dtype(s):
+            out[c] = _narrow_int(s)
+        elif c in FLOAT32_COLUMNS and pd.api.types.is_float_dtype(s):
+            out[c] = _narrow_float(s)
+        elif pd.api.types.is_string_dtype(s) and not pd.api.types.is_datetime64_any_dtype(s):
+            n = s.nunique(dropna=True)
+            out[c] = s.astype("category") if n <= CATEGORY_MAX_RATIO * len(s) else s
+        else:
+            out[c] = s
+    return pd.DataFrame(out, index=df.index)
+
+# =============================================================================
+# Memory report
+# =============================================================================
+def column_bytes(df: pd.DataFrame) -> pd.Series:
+    return df.memory_usage(deep=True, index=False)
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame, derived: list[str] = TOL_COLUMNS) -> pd.DataFrame:
+    """Per column: dtype and bytes before/after; `derived` were float64 before."""
+    b, a = column_bytes(before), column_bytes(after)
+    for c in derived:
+        if c not in b.index:
+            b[c] = 8 * len(before)
+    cols = list(dict.fromkeys([*before.columns, *derived, *after.columns]))
+    rep = pd.DataFrame({
+        "column": cols,
+        "dtype_before": [str(before[c].dtype) if c in before.columns else "float64" for c in cols],
+        "bytes_before": [int(b.get(c, 0)) for c in cols],
+        "dtype_after": [str(after[c].dtype) if c in after.columns else "on demand" for c in cols],
+        "bytes_after": [int(a.get(c, 0)) for c in cols],
+    })
+    rep["saved_pct"] = 1 - rep["bytes_after"] / rep["bytes_before"].replace(0, np.nan)
+    total = rep[["bytes_before", "bytes_after"]].sum()
+    rep.loc[len(rep)] = ["TOTAL", "", total["bytes_before"], "", total["bytes_after"],
+                         1 - total["bytes_after"] / total["bytes_before"]]
+    return rep
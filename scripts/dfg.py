@@ -0,0 +1,125 @@
+"""
+Purpose
+Directly-follows graphs (DFG) from the sorted event log, sliced by case
+attributes (the dimensions of DIM_CANDIDATES in 02c_explore.py).
+
+Every pair of consecutive events in a case is an edge (from activity, to
+activity, transition time). Each case is mapped to its member code per
+dimension, so one weighted np.bincount over (member, from, to) keys gives the
+edge counts and transition-time sums of all members of a dimension at once.
+The result is a sparse long table (only edges that occur), one row per
+dimension, member and edge.
+
+Notes
+Mean transition times skip edges where a timestamp is missing. Cases that
+are not in the case table fall into the missing member.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from event_log import TS_MISSING, EventLog, SortedEvents, sort_events
+from otif_agg import encode_dimension
+
+ALL = "ALL"  # dimension/member label of the unsliced graph
+
+NS_PER_DAY = 86_400 * 10**9
+
+DFG_COLUMNS = ["dimension", "member", "source", "target", "count", "mean_days"]
+
+# =============================================================================
+# Edges
+# =============================================================================
+def _edges(ev: SortedEvents) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(segment, from, to, transition days or NaN) for consecutive events of a case."""
+    same = ev.seg[1:] == ev.seg[:-1]
+    src, dst = ev.activity[:-1][same], ev.activity[1:][same]
+    t0, t1 = ev.ts[:-1][same], ev.ts[1:][same]
+    days = np.where((t0 != TS_MISSING) & (t1 != TS_MISSING), (t1 - t0) / NS_PER_DAY, np.nan)
+    return ev.seg[1:][same], src, dst, days
+
+def _slice(members: list[str], dim: str, keys: np.ndarray, n_act: int,
+           timed: np.ndarray, days: np.ndarray, activities: np.ndarray) -> pd.DataFrame:
+    """Grouped bincount over (member, from, to) keys -> sparse edge rows."""
+    size = len(members) * n_act * n_act
+    count = np.bincount(keys, minlength=size)
+    n_timed = np.bincount(keys[timed], minlength=size)
+    total = np.bincount(keys[timed], weights=days[timed], minlength=size)
+
+    nz = np.flatnonzero(count)
+    m, rest = np.divmod(nz, n_act * n_act)
+    src, dst = np.divmod(rest, n_act)
+    mean = np.full(len(nz), np.nan)
+    np.divide(total[nz], n_timed[nz], out=mean, where=n_timed[nz] > 0)
+    return pd.DataFrame({
+        "dimension": dim,
+        "member": np.asarray(members, dtype=object)[m],
+        "source": activities[src],
+        "target": activities[dst],
+        "count": count[nz],
+        "mean_days": mean,
+    })
+
+def build_dfg(
+    log: EventLog,
+    cases: pd.DataFrame | None = None,
+    dims: list[str] | None = None,
+    ev: SortedEvents | None = None,
+) -> pd.DataFrame:
+    """
+    Sparse DFG edges for the whole log (dimension "ALL") and for every member
+    of every dimension in `dims` (columns of `cases`, matched on CASE_KEY).
+    """
+    if ev is None:
+        ev = sort_events(log)
+    seg, src, dst, days = _edges(ev)
+    n_act = len(log.activities)
+    edge = src.astype(np.int64) * n_act + dst
+    timed = ~np.isnan(days)
+
+    parts = [_slice([ALL], ALL, edge, n_act, timed, days, log.activities)]
+    if dims:
+        by_key = cases.drop_duplicates("CASE_KEY", keep="last").set_index("CASE_KEY")
+        seg_rows = by_key.reindex(log.case_keys[ev.cases])  # case-table row per segment
+        for dim in dims:
+            codes, members = encode_dimension(seg_rows[dim])
+            keys = codes[seg] * (n_act * n_act) + edge
+            parts.append(_slice(members, dim, keys, n_act, timed, days, log.activities))
+    return pd.concat(parts, ignore_index=True)[DFG_COLUMNS]
+
+# =============================================================================
+# Pruning / export
+# =============================================================================
+def top_k_edges(dfg: pd.DataFrame, k: int) -> pd.DataFrame:
+    """Keep the k most frequent edges per dimension member (for rendering)."""
+    ranked = dfg.sort_values(["dimension", "member", "count", "source", "target"],
+                             ascending=[True, True, False, True, True], kind="stable")
+    return ranked.groupby(["dimension", "member"], sort=False).head(k).reset_index(drop=True)
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def dfg_path(path: Path) -> Path:
+    """Where export_dfg writes `path`: .parquet, or .csv.gz without pyarrow."""
+    return Path(path).with_suffix(".parquet" if _has_pyarrow() else ".csv.gz")
+
+def export_dfg(dfg: pd.DataFrame, path: Path) -> Path:
+    """
+    Write the edge table compactly: Parquet with dictionary-encoded labels
+    (zstd) if pyarrow is installed, else gzip CSV. Returns the written path.
+    """
+    path = dfg_path(path)
+    if path.suffix != ".parquet":
+        dfg.to_csv(path, index=False, compression="gzip")
+        return path
+    out = dfg.astype({c: "category" for c in ["dimension", "member", "source", "target"]})
+    out.to_parquet(path, index=False, compression="zstd")
+    return path
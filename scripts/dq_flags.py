@@ -0,0 +1,416 @@
+"""
+Purpose
+Data quality flag rules, the compact flag table and flag CSV export.
+
+FLAG_RULES is the rule registry: which rows a rule flags, the columns it
+needs, its metrics (extra) and how its CSV is sorted. A rule's bit is its
+position in the list. rule_masks evaluates all applicable rules in one pass
+over the frame; the masks are shared by both outputs:
+- the flag table (FLAG_TABLE_NAME): one row per flagged case with CASE_KEY,
+  FLAG_BITS (bitmask over the rules) and the rule metrics (set only where that
+  rule fired), as zstd Parquet (gzip CSV without pyarrow). FLAG_LEGEND maps
+  bits to rules. project=True adds the columns the rules need.
+- the per-rule flag CSVs (flag_*.csv), full rows as before; project=True keeps
+  only CASE_KEY, the needed, metric and sort columns.
+
+export_flags writes them from an in-memory case table. FlagSpool writes the
+same files from a stream of case chunks: each chunk's flagged rows are sorted
+and spilled as a Parquet run, and the runs are k-way merged into the CSV at
+the end, so memory stays bounded by the chunk size and the output matches
+export_flags. The flag table is appended chunk by chunk.
+
+Notes
+Up to 64 rules fit the bitmask (uint8 up to 8 rules, then 16/32/64 bits).
+Decode with `FLAG_BITS & (1 << bit) != 0`.
+"""
+
+from __future__ import annotations
+
+import heapq
+import shutil
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from case_memory import with_tol_bounds
+
+SPOOL_BATCH = 50_000  # rows per run batch / CSV block while merging
+FLAG_TABLE_NAME = "flag_table"  # .parquet, or .csv.gz without pyarrow
+FLAG_LEGEND = "flag_rules.csv"
+FLAG_KEY_DTYPE = "Int64"  # CASE_KEY in the flag table, in memory and streamed alike
+
+# =============================================================================
+# Rules
+# =============================================================================
+class FlagRule(NamedTuple):
+    filename: str
+    reason: str
+    needs: list[str]
+    mask: Callable[[pd.DataFrame], pd.Series]
+    sort_cols: list[str]
+    ascending: list[bool]
+    extra: Callable[[pd.DataFrame], dict[str, pd.Series]] | None = None
+
+def value_rel_err(df: pd.DataFrame) -> pd.Series:
+    approx = df["UNIT_PRICE"] * df["DELIVERED_QUANTITY"]
+    return (df["ORDER_VALUE"] - approx).abs() / approx.replace(0, np.nan)
+
+def _rel_err_gt_10pct(df: pd.DataFrame) -> pd.Series:
+    rel_err = value_rel_err(df)
+    return rel_err.gt(0.10) & rel_err.notna()
+
+FLAG_RULES = [
+    FlagRule(
+        "flag_unit_price_zero.csv", "UNIT_PRICE==0", ["UNIT_PRICE"],
+        lambda d: d["UNIT_PRICE"].eq(0),
+        ["ORDER_VALUE", "CASE_KEY"], [False, True],
+    ),
+    FlagRule(
+        "flag_order_value_zero.csv", "ORDER_VALUE==0", ["ORDER_VALUE"],
+        lambda d: d["ORDER_VALUE"].eq(0),
+        ["UNIT_PRICE", "CASE_KEY"], [False, True],
+    ),
+    FlagRule(
+        "flag_value_mismatch_relerr_gt_10pct.csv", "VALUE_REL_ERR>0.10",
+        ["ORDER_VALUE", "UNIT_PRICE", "DELIVERED_QUANTITY"],
+        _rel_err_gt_10pct,
+        ["VALUE_REL_ERR", "ORDER_VALUE", "CASE_KEY"], [False, False, True],
+        extra=lambda d: {"VALUE_REL_ERR": value_rel_err(d)},
+    ),
+]
+
+def rule_name(rule: FlagRule) -> str:
+    """Short rule name: "flag_unit_price_zero.csv" -> "unit_price_zero"."""
+    return Path(rule.filename).stem.removeprefix("flag_")
+
+def rule_legend(rules: list[FlagRule] = FLAG_RULES) -> pd.DataFrame:
+    return pd.DataFrame({
+        "bit": range(len(rules)),
+        "rule": [rule_name(r) for r in rules],
+        "reason": [r.reason for r in rules],
+        "needs": [" ".join(r.needs) for r in rules],
+    })
+
+def _sort_spec(d: pd.DataFrame, rule: FlagRule) -> tuple[list[str], list[bool]]:
+    cols = [c for c in rule.sort_cols if c in d.columns]
+    return cols, rule.ascending[:len(cols)]
+
+def _metric_names(rule: FlagRule, df: pd.DataFrame) -> list[str]:
+    return [] if rule.extra is None else list(rule.extra(df.iloc[:0]))
+
+def rule_masks(df: pd.DataFrame, rules: list[FlagRule] = FLAG_RULES) -> dict[int, np.ndarray]:
+    """{bit: row mask} for the rules whose columns are all in `df`."""
+    masks = {}
+    for i, rule in enumerate(rules):
+        if all(c in df.columns for c in rule.needs):
+            masks[i] = pd.Series(rule.mask(df)).to_numpy(dtype=bool, na_value=False)
+    return masks
+
+def _bits_dtype(n_rules: int) -> type:
+    for t in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_rules <= np.iinfo(t).bits:
+            return t
+    raise ValueError(f"{n_rules} flag rules do not fit a 64-bit mask.")
+
+def flag_frame(
+    df: pd.DataFrame,
+    rule: FlagRule,
+    mask: np.ndarray | None = None,
+    project: bool = False,
+) -> pd.DataFrame | None:
+    """
+    Flagged rows of `df` for `rule`, with FLAG_REASON first, sorted. `mask`
+    is the rule's precomputed mask (see rule_masks); project=True keeps only
+    CASE_KEY and the columns the rule needs or sorts by.
+    """
+    if not all(c in df.columns for c in rule.needs):
+        return None
+    m = rule.mask(df) if mask is None else mask
+    if not m.any():
+        return None
+    if project:
+        cols = [c for c in dict.fromkeys(["CASE_KEY", *rule.needs, *rule.sort_cols]) if c in df.columns]
+        out = df.loc[m, cols]
+    else:
+        out = with_tol_bounds(df.loc[m].copy())  # TOL_LOWER/TOL_UPPER are computed, not stored
+    if rule.extra is not None:
+        for c, v in rule.extra(out).items():
+            out[c] = v
+    out.insert(0, "FLAG_REASON", rule.reason)
+    cols, asc = _sort_spec(out, rule)
+    return out.sort_values(cols, ascending=asc) if cols else out
+
+def flag_table(
+    df: pd.DataFrame,
+    rules: list[FlagRule] = FLAG_RULES,
+    project: bool = False,
+    masks: dict[int, np.ndarray] | None = None,
+) -> pd.DataFrame:
+    """
+    One row per case flagged by any rule, in frame order: CASE_KEY, FLAG_BITS
+    and the rule metrics (NaN where the rule did not fire); project=True adds
+    the columns the applicable rules need.
+    """
+    if masks is None:
+        masks = rule_masks(df, rules)
+    dtype = _bits_dtype(len(rules))
+    bits = np.zeros(len(df), dtype=dtype)
+    for i, m in masks.items():
+        bits[m] |= dtype(1 << i)
+    hit = bits != 0
+
+    out = {}
+    if "CASE_KEY" in df.columns:  # one key dtype, however compact the frame or chunk is
+        out["CASE_KEY"] = pd.array(df["CASE_KEY"], dtype=FLAG_KEY_DTYPE)[hit]
+    out["FLAG_BITS"] = bits[hit]
+    for i, m in masks.items():
+        rule = rules[i]
+        for c in _metric_names(rule, df):
+            out.setdefault(c, np.full(int(hit.sum()), np.nan))
+        if rule.extra is not None and m.any():
+            at = np.flatnonzero(m[hit])
+            for c, v in rule.extra(df.loc[m]).items():
+                out[c][at] = v.to_numpy(dtype=float, na_value=np.nan)
+    if project:
+        for c in dict.fromkeys(c for i in masks for c in rules[i].needs):
+            out.setdefault(c, df[c].to_numpy()[hit])
+    return pd.DataFrame(out)
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def flag_table_path(flags_dir: Path) -> Path:
+    """Where the flag table is written: .parquet, or .csv.gz without pyarrow."""
+    return Path(flags_dir) / (FLAG_TABLE_NAME + (".parquet" if _has_pyarrow() else ".csv.gz"))
+
+class FlagTableWriter:
+    """Appends flag_table frames to one file; close() returns its path."""
+
+    def __init__(self, path: Path):
+        self.parquet = _has_pyarrow()
+        self.path = Path(path).with_suffix(".parquet" if self.parquet else ".csv.gz")
+        self.writer = None
+        self.schema = None
+        self.header = True
+
+    def add(self, table: pd.DataFrame) -> None:
+        if not self.parquet:
+            table.to_csv(self.path, index=False, header=self.header,
+                         mode="w" if self.header else "a", compression="gzip")
+            self.header = False
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.schema is None:
+            self.schema = pa.Schema.from_pandas(table, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        self.writer.write_table(pa.Table.from_pandas(table, schema=self.schema, preserve_index=False))
+
+    def close(self) -> Path:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        return self.path
+
+def write_flag_table(table: pd.DataFrame, flags_dir: Path, rules: list[FlagRule] = FLAG_RULES) -> Path:
+    """Write the flag table and its legend to `flags_dir`; returns the table path."""
+    w = FlagTableWriter(Path(flags_dir) / FLAG_TABLE_NAME)
+    w.add(table)
+    rule_legend(rules).to_csv(Path(flags_dir) / FLAG_LEGEND, index=False)
+    return w.close()
+
+def export_flags(
+    df: pd.DataFrame,
+    flags_dir: Path,
+    rules: list[FlagRule] = FLAG_RULES,
+    csvs: bool = True,
+    table: bool = True,
+    project: bool = False,
+) -> None:
+    """Per-rule flag CSVs and/or the flag table, from one evaluation of the rules."""
+    masks = rule_masks(df, rules)
+    if csvs:
+        for i, rule in enumerate(rules):
+            out = flag_frame(df, rule, masks[i], project) if i in masks else None
+            if out is not None:
+                out.to_csv(Path(flags_dir) / rule.filename, index=False)
+    if table:
+        write_flag_table(flag_table(df, rules, project, masks), flags_dir, rules)
+
+# =============================================================================
+# Streaming export (sorted runs + k-way merge)
+# =============================================================================
+def _unify_dtypes(seen: dict[str, set]) -> dict[str, object]:
+    """
+    One dtype per column over all chunks, as the in-memory frame would have it
+    (e.g. DELTA_DAYS is int in chunks without NaT, float overall).
+    """
+    out = {}
+    for c, dts in seen.items():
+        if any(isinstance(t, pd.CategoricalDtype) for t in dts):
+            out[c] = "object"
+        elif len(dts) == 1:
+            out[c] = next(iter(dts))
+        elif all(pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t) for t in dts):
+            out[c] = "float64"
+        else:
+            out[c] = "object"
+    return out
+
+def _sort_keys(d: pd.DataFrame, cols: list[str], asc: list[bool]) -> list[np.ndarray]:
+    """Per column: (is_missing, value) arrays that sort like sort_values(na_position="last")."""
+    keys = []
+    for c, a in zip(cols, asc):
+        s = d[c]
+        miss = s.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            v = s.to_numpy(dtype=float, na_value=np.nan)
+            v = np.where(miss, 0.0, v if a else -v)
+        elif a:
+            v = s.astype(object).where(~miss, "").to_numpy()
+        else:
+            raise ValueError(f"Descending sort on non-numeric flag column {c!r} cannot be streamed.")
+        keys += [miss, v]
+    return keys
+
+class _Run:
+    """Reads one sorted spill run batch by batch; yields heap keys, keeps rows."""
+
+    def __init__(self, path: Path, run_id: int, rule: FlagRule, dtypes: dict[str, object]):
+        import pyarrow.parquet as pq
+        self.batches = pq.ParquetFile(path).iter_batches(batch_size=SPOOL_BATCH)
+        self.run_id = run_id
+        self.rule = rule
+        self.dtypes = dtypes
+        self.frames: deque[pd.DataFrame] = deque()
+        self.pos = 0  # consumed rows of frames[0]
+
+    def keys(self):
+        n = 0
+        for b in self.batches:
+            d = b.to_pandas().astype(self.dtypes)
+            self.frames.append(d)
+            cols, asc = _sort_spec(d, self.rule)
+            for i, k in enumerate(zip(*_sort_keys(d, cols, asc))):
+                yield (*k, self.run_id, n + i)
+            n += len(d)
+
+    def take(self, k: int) -> list[pd.DataFrame]:
+        parts = []
+        while k:
+            head = self.frames[0]
+            j = min(k, len(head) - self.pos)
+            parts.append(head.iloc[self.pos:self.pos + j])
+            self.pos += j
+            k -= j
+            if self.pos == len(head):
+                self.frames.popleft()
+                self.pos = 0
+        return parts
+
+class FlagSpool:
+    """Streaming counterpart of export_flags: add() chunks, then finish()."""
+
+    def __init__(
+        self,
+        rules: list[FlagRule] = FLAG_RULES,
+        spool_dir: Path | None = None,
+        csvs: bool = True,
+        table: bool = True,
+        project: bool = False,
+    ):
+        self.rules = rules
+        self.csvs, self.project = csvs, project
+        self.dir = Path(tempfile.mkdtemp(prefix="flag_spool_", dir=spool_dir))
+        self.table = FlagTableWriter(self.dir / FLAG_TABLE_NAME) if table else None
+        self.runs: dict[int, list[Path]] = {i: [] for i in range(len(rules))}
+        self.seen: dict[str, set] = {}   # column -> dtypes over all chunks
+        self.has_time: set[str] = set()  # datetime columns with a time part in flagged rows
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        masks = rule_masks(chunk, self.rules)
+        if self.table is not None:
+            self.table.add(flag_table(chunk, self.rules, self.project, masks))
+        if not self.csvs:
+            return
+        for c in chunk.columns:
+            self.seen.setdefault(c, set()).add(chunk[c].dtype)
+        for i, rule in enumerate(self.rules):
+            out = flag_frame(chunk, rule, masks[i], self.project) if i in masks else None
+            if out is None:
+                continue
+            for c in out.columns:
+                if pd.api.types.is_datetime64_any_dtype(out[c]):
+                    v = out[c].dropna()
+                    if (v != v.dt.normalize()).any():
+                        self.has_time.add(c)
+            p = self.dir / f"{i:03d}_{len(self.runs[i]):06d}.parquet"
+            out.to_parquet(p, index=False)
+            self.runs[i].append(p)
+
+    def _merge(self, i: int, target: Path) -> None:
+        import pyarrow.parquet as pq
+        rule = self.rules[i]
+        columns = pq.read_schema(self.runs[i][0]).names
+        dtypes = _unify_dtypes({c: self.seen.get(c, set()) or {np.dtype(float)} for c in columns})
+        dtypes = {c: t for c, t in dtypes.items() if c != "FLAG_REASON"}
+        runs = [_Run(p, r, rule, dtypes) for r, p in enumerate(self.runs[i])]
+
+        # pandas writes a datetime column date-only when no value has a time part
+        date_fmt = {c: "%Y-%m-%d %H:%M:%S" if c in self.has_time else "%Y-%m-%d"
+                    for c, t in dtypes.items() if pd.api.types.is_datetime64_any_dtype(t)}
+
+        merged = heapq.merge(*(r.keys() for r in runs))
+        header = True
+        while True:
+            order = [item[-2] for _, item in zip(range(SPOOL_BATCH), merged)]
+            if not order:
+                break
+            order = np.asarray(order)
+            counts = np.bincount(order, minlength=len(runs))
+            parts, starts = [], np.zeros(len(runs), dtype=np.int64)
+            offset = 0
+            for r, k in enumerate(counts):
+                starts[r] = offset
+                if k:
+                    parts += runs[r].take(int(k))
+                    offset += int(k)
+            block = pd.concat(parts, ignore_index=True)
+            # position of each output row inside `block`
+            rank = np.zeros(len(order), dtype=np.int64)
+            seen = np.zeros(len(runs), dtype=np.int64)
+            for j, r in enumerate(order):
+                rank[j] = starts[r] + seen[r]
+                seen[r] += 1
+            block = block.iloc[rank]
+            for c, fmt in date_fmt.items():
+                block[c] = block[c].dt.strftime(fmt)
+            block.to_csv(target, index=False, header=header, mode="w" if header else "a")
+            header = False
+
+    def finish(self, flags_dir: Path) -> None:
+        try:
+            for i, rule in enumerate(self.rules):
+                if self.runs[i]:
+                    self._merge(i, Path(flags_dir) / rule.filename)
+            if self.table is not None:
+                path = self.table.close()
+                if path.exists():
+                    shutil.move(path, Path(flags_dir) / path.name)
+                rule_legend(self.rules).to_csv(Path(flags_dir) / FLAG_LEGEND, index=False)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Remove the spill runs (also safe after finish)."""
+        if self.table is not None:
+            self.table.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
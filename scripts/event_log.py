@@ -0,0 +1,300 @@
+"""
+Purpose
+Columnar loading of the Woodcorp O2C activity table (event log).
+
+The activity table is streamed in blocks and kept as flat numpy arrays, one
+entry per event:
+- case:     dense case codes (0..n_cases-1), original keys in case_keys
+- activity: dictionary codes into `activities` (activity names)
+- ts:       event time as int64 nanoseconds since epoch (NaT = TS_MISSING)
+- sorting:  business SORTING value (SORTING_MISSING if absent)
+
+Frequencies, per-case event counts and per-case activity sets are then plain
+bincount / indexing operations on these arrays.
+
+Notes
+Only the columns in EVENT_COLUMNS are read. Events keep the file order;
+sort_events puts them in execution order (timestamp, then SORTING) and cuts
+them into per-case segments for the engines built on top (variants, gaps).
+"""
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from case_ingest import sniff_delimiter
+
+# Role -> column name in activity.csv
+EVENT_COLUMNS = {
+    "case": "CASE_KEY",
+    "activity": "ACTIVITY_EN",
+    "time": "EVENTTIME",  # <- adjust if the export names it differently
+    "sorting": "SORTING",
+}
+
+BLOCK_BYTES = 16 << 20  # Arrow read block; one block is parsed at a time
+
+TS_MISSING = np.iinfo(np.int64).min  # same bit pattern as NaT
+SORTING_MISSING = np.iinfo(np.int32).max  # sorts after every real SORTING value
+
+class EventLog(NamedTuple):
+    case: np.ndarray          # int64, dense case code per event
+    case_keys: np.ndarray     # original CASE_KEY per case code
+    activity: np.ndarray      # int32, activity code per event (-1 = missing)
+    activities: np.ndarray    # activity names, indexed by code
+    ts: np.ndarray            # int64 ns since epoch
+    sorting: np.ndarray       # int32
+
+    @property
+    def n_events(self) -> int:
+        return len(self.case)
+
+    @property
+    def n_cases(self) -> int:
+        return len(self.case_keys)
+
+# =============================================================================
+# Reading
+# =============================================================================
+def _resolve_columns(path: Path, sep: str, columns: dict[str, str], encoding: str) -> dict[str, str]:
+    """Role -> raw header name for the roles present in the file."""
+    with open(path, "r", encoding=encoding, newline="") as f:
+        raw = {c.strip().strip('"'): c for c in next(csv.reader(f, delimiter=sep))}
+    return {role: raw[name] for role, name in columns.items() if name in raw}
+
+def _arrow_blocks(path: Path, sep: str, cols: dict[str, str], encoding: str):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    column_types = {cols["activity"]: pa.dictionary(pa.int32(), pa.string())} if "activity" in cols else {}
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(encoding=encoding, block_size=BLOCK_BYTES),
+        parse_options=pacsv.ParseOptions(delimiter=sep),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=list(cols.values()),
+            column_types=column_types,
+            strings_can_be_null=False,  # "" stays an (empty) activity name, as in csv.reader
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+def _pandas_blocks(path: Path, sep: str, cols: dict[str, str], encoding: str, rows: int):
+    dtypes = {c: str for c in cols.values()}
+    if "activity" in cols:
+        dtypes[cols["activity"]] = "category"
+    yield from pd.read_csv(path, sep=sep, usecols=list(cols.values()), dtype=dtypes,
+                           keep_default_na=False, encoding=encoding, engine="c", chunksize=rows)
+
+def iter_event_blocks(
+    path: Path,
+    columns: dict[str, str] = EVENT_COLUMNS,
+    sep: str | None = None,
+    engine: str = "pyarrow",
+    encoding: str = "utf-8",
+):
+    """
+    Stream the activity table as DataFrames with one column per role
+    ("case", "activity", ...), reading only the needed columns. The
+    activity column comes out as a categorical.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"CSV not found: {path.resolve()}")
+    if sep is None:
+        try:
+            sep = sniff_delimiter(path, encoding=encoding)
+        except ValueError:
+            sep = ","  # narrow file (<= 3 columns): csv default, as before
+    cols = _resolve_columns(path, sep, columns, encoding)
+    if not cols:
+        raise ValueError(f"None of {list(columns.values())} found in {path}")
+
+    blocks = None
+    if engine == "pyarrow":
+        try:
+            import pyarrow.csv  # noqa: F401
+            blocks = _arrow_blocks(path, sep, cols, encoding)
+        except ImportError:
+            pass
+    if blocks is None:
+        blocks = _pandas_blocks(path, sep, cols, encoding, rows=max(BLOCK_BYTES // 64, 1))
+
+    for block in blocks:
+        yield block.rename(columns={raw: role for role, raw in cols.items()})
+
+def unique_activities(path: Path, columns: dict[str, str] = EVENT_COLUMNS, **kwargs) -> set[str]:
+    """
+    Distinct non-empty activity names. Streams the activity column only and
+    looks at each block's dictionary, never at the individual events.
+    """
+    names: set[str] = set()
+    for block in iter_event_blocks(path, {"activity": columns["activity"]}, **kwargs):
+        s = block["activity"]
+        names.update(s.cat.remove_unused_categories().cat.categories)
+    names.discard("")
+    return names
+
+# =============================================================================
+# Encoding
+# =============================================================================
+def _encode_activity(s: pd.Series, lookup: dict[str, int]) -> np.ndarray:
+    """Block-local dictionary codes -> global codes (the dictionary is tiny)."""
+    cats = s.cat.categories
+    remap = np.array([lookup.setdefault(str(c), len(lookup)) for c in cats] + [-1], dtype=np.int32)
+    codes = s.cat.codes.to_numpy()
+    return remap[np.where(codes < 0, len(cats), codes)]
+
+def _encode_case(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(s):
+        return s.to_numpy()
+    v = pd.to_numeric(s, errors="coerce")
+    if v.notna().all() and (v == v.round()).all():
+        return v.to_numpy(dtype=np.int64)
+    return s.astype(str).to_numpy(dtype=object)
+
+def _encode_time(s: pd.Series) -> np.ndarray:
+    if not pd.api.types.is_datetime64_any_dtype(s):
+        s = pd.to_datetime(s, errors="coerce")
+    if getattr(s.dt, "tz", None) is not None:
+        s = s.dt.tz_convert("UTC").dt.tz_localize(None)
+    return s.astype("datetime64[ns]").to_numpy().view(np.int64)
+
+def _encode_sorting(s: pd.Series) -> np.ndarray:
+    v = pd.to_numeric(s, errors="coerce")
+    return v.fillna(SORTING_MISSING).to_numpy(dtype=np.int64).clip(max=SORTING_MISSING).astype(np.int32)
+
+def read_event_log(
+    path: Path,
+    columns: dict[str, str] = EVENT_COLUMNS,
+    sep: str | None = None,
+    engine: str = "pyarrow",
+    encoding: str = "utf-8",
+) -> EventLog:
+    """Read the activity table into an EventLog (one streaming pass)."""
+    lookup: dict[str, int] = {}
+    keys, acts, times, sorts = [], [], [], []
+    for block in iter_event_blocks(path, columns, sep=sep, engine=engine, encoding=encoding):
+        n = len(block)
+        keys.append(_encode_case(block["case"]) if "case" in block else np.zeros(n, dtype=np.int64))
+        acts.append(_encode_activity(block["activity"], lookup) if "activity" in block
+                    else np.full(n, -1, dtype=np.int32))
+        times.append(_encode_time(block["time"]) if "time" in block else np.full(n, TS_MISSING))
+        sorts.append(_encode_sorting(block["sorting"]) if "sorting" in block
+                     else np.full(n, SORTING_MISSING, dtype=np.int32))
+
+    if not keys:
+        empty = np.array([], dtype=np.int64)
+        return EventLog(empty, empty, empty.astype(np.int32), np.array([], dtype=object),
+                        empty, empty.astype(np.int32))
+
+    if not {k.dtype.kind for k in keys} <= set("iuf"):  # text ids (in some blocks)
+        keys = [k.astype(str).astype(object) for k in keys]
+    all_keys = np.concatenate(keys)
+    if all_keys.dtype.kind == "f" and np.isfinite(all_keys).all() and (all_keys == np.round(all_keys)).all():
+        all_keys = all_keys.astype(np.int64)  # int ids that Arrow read as float in some block
+    case, case_keys = pd.factorize(all_keys, sort=True, use_na_sentinel=False)
+
+    # activity codes in name order, independent of the order of first appearance
+    names = np.array(list(lookup), dtype=object)
+    order = np.argsort(names.astype(str), kind="stable")
+    remap = np.empty(len(names) + 1, dtype=np.int32)
+    remap[order] = np.arange(len(names), dtype=np.int32)
+    remap[-1] = -1
+    return EventLog(
+        case=case.astype(np.int64),
+        case_keys=np.asarray(case_keys),
+        activity=remap[np.concatenate(acts)],
+        activities=names[order],
+        ts=np.concatenate(times),
+        sorting=np.concatenate(sorts),
+    )
+
+# =============================================================================
+# Queries
+# =============================================================================
+def activity_counts(log: EventLog) -> pd.Series:
+    """Events per activity, most frequent first."""
+    a = log.activity[log.activity >= 0]
+    counts = np.bincount(a, minlength=len(log.activities))
+    out = pd.Series(counts, index=pd.Index(log.activities, name="activity"), name="events")
+    return out.sort_values(ascending=False, kind="stable")
+
+def case_event_counts(log: EventLog) -> pd.Series:
+    counts = np.bincount(log.case, minlength=log.n_cases)
+    return pd.Series(counts, index=pd.Index(log.case_keys, name="CASE_KEY"), name="events")
+
+def case_activity_matrix(log: EventLog) -> np.ndarray:
+    """Boolean (n_cases, n_activities) matrix: which activities occur per case."""
+    m = np.zeros((log.n_cases, len(log.activities)), dtype=bool)
+    ok = log.activity >= 0
+    m[log.case[ok], log.activity[ok]] = True
+    return m
+
+def case_activity_sets(log: EventLog) -> pd.DataFrame:
+    """case_activity_matrix as a frame: CASE_KEY rows, activity name columns."""
+    return pd.DataFrame(
+        case_activity_matrix(log),
+        index=pd.Index(log.case_keys, name="CASE_KEY"),
+        columns=pd.Index(log.activities, name="activity"),
+    )
+
+def cases_with(log: EventLog, activity: str) -> np.ndarray:
+    """Case codes that contain `activity` at least once."""
+    hit = np.flatnonzero(log.activities == activity)
+    if not len(hit):
+        return np.array([], dtype=np.int64)
+    return np.unique(log.case[log.activity == hit[0]])
+
+# =============================================================================
+# Execution order
+# =============================================================================
+class SortedEvents(NamedTuple):
+    """Events in execution order, cut into one contiguous segment per case."""
+    case: np.ndarray      # case code per event
+    activity: np.ndarray  # activity code per event
+    ts: np.ndarray        # int64 ns per event
+    sorting: np.ndarray   # int32 per event
+    starts: np.ndarray    # first event of each segment
+    lengths: np.ndarray   # events per segment
+    seg: np.ndarray       # segment per event
+    pos: np.ndarray       # position of the event inside its segment
+
+    @property
+    def cases(self) -> np.ndarray:
+        """Case code per segment."""
+        return self.case[self.starts]
+
+def event_order(log: EventLog, use_time: bool = True) -> np.ndarray:
+    """Event permutation: by case, then timestamp (NaT last), SORTING, activity."""
+    keys = [log.activity, log.sorting]
+    if use_time:
+        keys.append(np.where(log.ts == TS_MISSING, np.iinfo(np.int64).max, log.ts))
+    keys.append(log.case)
+    return np.lexsort(keys)
+
+def sort_events(log: EventLog, use_time: bool = True) -> SortedEvents:
+    """One lexsort; events without an activity are dropped."""
+    order = event_order(log, use_time)
+    order = order[log.activity[order] >= 0]
+    case = log.case[order]
+
+    starts = np.flatnonzero(np.r_[True, case[1:] != case[:-1]]) if len(case) else np.array([], dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(case)]).astype(np.int64)
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    return SortedEvents(
+        case=case,
+        activity=log.activity[order],
+        ts=log.ts[order],
+        sorting=log.sorting[order],
+        starts=starts,
+        lengths=lengths,
+        seg=seg,
+        pos=np.arange(len(case)) - starts[seg],
+    )
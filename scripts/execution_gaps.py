@@ -0,0 +1,91 @@
+"""
+Purpose
+Execution-gap rules evaluated over the sorted event log.
+
+A rule is declarative (GapRule): which activities count as the gap event,
+optionally only after an anchor activity has already happened in the same
+case (e.g. after "Start production" = order release), and how many such
+events make the gap. All rules are evaluated together: one per-case
+cumulative count per distinct anchor ("seen anchor yet" masks), one event x
+rule hit matrix, and a single np.add.reduceat over the case segments. Adding
+a rule adds a column, not a pass.
+
+Notes
+Gap definitions follow docs/methodology.md and
+docs/notes/initial_happy_path-execution_gaps.md. The result is a boolean
+CASE_KEY x rule frame that joins onto the case table (join_gaps).
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from event_log import EventLog, SortedEvents, sort_events
+
+class GapRule(NamedTuple):
+    name: str
+    events: list[str]          # activities that count as gap events
+    after: str | None = None   # only count them once this activity happened earlier in the case
+    min_count: int = 1         # gap if at least this many counted events
+
+CHANGE_ACTIVITIES = [
+    "Change price",
+    "Change production start date",
+    "Change delivery date",
+    "Change quantity",
+]
+
+GAP_RULES = [
+    GapRule("GAP_POST_RELEASE_QTY_CHANGE", ["Change quantity"], after="Start production"),
+    GapRule("GAP_REPEATED_START_DATE_CHANGE", ["Change production start date"], after="Start production", min_count=2),
+    GapRule("GAP_CREDIT_BLOCK", ["Credit order block"]),
+    GapRule("GAP_CREDIT_BLOCK_REWORK", ["Change price"], after="Credit order block"),
+    GapRule("GAP_CHANGE_AFTER_LOAD_SHIPMENT", CHANGE_ACTIVITIES, after="Load shipment"),
+]
+
+# =============================================================================
+# Evaluation
+# =============================================================================
+def _codes(log: EventLog, names: list[str]) -> np.ndarray:
+    return np.flatnonzero(np.isin(log.activities, names))
+
+def _seen_before(ev: SortedEvents, anchor: np.ndarray) -> np.ndarray:
+    """Per event: has an anchor event occurred earlier in the same case?"""
+    is_anchor = np.isin(ev.activity, anchor)
+    cum = np.cumsum(is_anchor)
+    before = cum - is_anchor  # anchors strictly before, counted over the whole log
+    return before - before[ev.starts][ev.seg] > 0
+
+def gap_counts(log: EventLog, rules: list[GapRule] = GAP_RULES, ev: SortedEvents | None = None) -> pd.DataFrame:
+    """Counted gap events per case (CASE_KEY x rule)."""
+    if ev is None:
+        ev = sort_events(log)
+
+    seen = {a: _seen_before(ev, _codes(log, [a])) for a in {r.after for r in rules if r.after}}
+    hits = np.zeros((len(ev.activity), len(rules)), dtype=np.int32)
+    for j, rule in enumerate(rules):
+        m = np.isin(ev.activity, _codes(log, rule.events))
+        if rule.after:
+            m &= seen[rule.after]
+        hits[:, j] = m
+
+    counts = np.add.reduceat(hits, ev.starts, axis=0) if len(ev.starts) else hits[:0]
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(log.case_keys[ev.cases], name="CASE_KEY"),
+        columns=[r.name for r in rules],
+    )
+
+def gap_matrix(log: EventLog, rules: list[GapRule] = GAP_RULES, ev: SortedEvents | None = None) -> pd.DataFrame:
+    """Boolean gap flags per case (CASE_KEY x rule)."""
+    counts = gap_counts(log, rules, ev)
+    return counts >= np.array([r.min_count for r in rules])
+
+def join_gaps(cases: pd.DataFrame, gaps: pd.DataFrame) -> pd.DataFrame:
+    """Left-join gap flags onto the case table; cases without events get False."""
+    out = cases.join(gaps, on="CASE_KEY")
+    out[gaps.columns] = out[gaps.columns].fillna(False).astype(bool)
+    return out
@@ -0,0 +1,116 @@
+"""
+Purpose
+Content-addressed Parquet cache for the cleaned, KPI-engineered case table.
+
+An entry is keyed by a hash of the raw case file contents and a hash of the
+KPI code version, so a changed export or changed KPI logic never hits an old
+entry. Entries are loaded with memory mapping. Whenever an entry is written,
+entries for older versions of the same source file (same resolved path) and
+entries built by other code versions are deleted.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]  # scripts/ -> project root
+CACHE_DIR = PROJECT_ROOT / "data" / ".cache"
+
+HASH_CHUNK = 1 << 20
+
+# =============================================================================
+# Keys
+# =============================================================================
+def file_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def code_digest(code_version: str) -> str:
+    return hashlib.blake2b(code_version.encode("utf-8"), digest_size=8).hexdigest()
+
+def _slug(path: Path) -> str:
+    """Readable file stem plus a hash of the resolved path, so same-named files elsewhere get their own slug."""
+    path = Path(path).resolve()
+    stem = re.sub(r"[^A-Za-z0-9]+", "_", path.stem).strip("_").lower() or "cases"
+    return f"{stem}_{hashlib.blake2b(str(path).encode('utf-8'), digest_size=4).hexdigest()}"
+
+def cache_path(source: Path, code_version: str, cache_dir: Path = CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{_slug(source)}-{file_digest(source)}-{code_digest(code_version)}.parquet"
+
+# =============================================================================
+# Eviction
+# =============================================================================
+def evict_stale(entry: Path, code_version: str) -> list[Path]:
+    """
+    Delete entries that can never be hit again:
+    same source slug with another file digest, or another code version.
+    """
+    slug = entry.name.split("-")[0]
+    current = code_digest(code_version)
+    removed = []
+    for p in entry.parent.glob("*.parquet"):
+        if p == entry:
+            continue
+        parts = p.stem.split("-")
+        if len(parts) != 3:
+            continue
+        if parts[0] == slug or parts[2] != current:
+            p.unlink(missing_ok=True)
+            removed.append(p)
+    return removed
+
+# =============================================================================
+# Load / build
+# =============================================================================
+def _read(path: Path) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+def _write(df: pd.DataFrame, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)  # readers never see a half-written entry
+
+def load_or_build(
+    source: Path,
+    build: Callable[[], pd.DataFrame],
+    code_version: str,
+    cache_dir: Path = CACHE_DIR,
+    rebuild: bool = False,
+) -> pd.DataFrame:
+    """
+    Return the cached table for `source` if present, else `build()` it and
+    store it. rebuild=True ignores (and replaces) an existing entry.
+    Without pyarrow the cache is skipped and `build()` is returned as is.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("pyarrow not installed, KPI cache disabled.")
+        return build()
+
+    source = Path(source)
+    if not source.exists():
+        raise FileNotFoundError(f"CSV not found: {source.resolve()}")
+
+    entry = cache_path(source, code_version, cache_dir)
+    if entry.exists() and not rebuild:
+        try:
+            return _read(entry)
+        except Exception as e:  # corrupt entry: rebuild below
+            print(f"Ignoring unreadable cache entry {entry.name}: {e}")
+
+    df = build()
+    _write(df, entry)
+    evict_stale(entry, code_version)
+    return df
@@ -0,0 +1,169 @@
+"""
+Purpose
+Single-pass OTIF aggregation over several business dimensions.
+
+Every dimension is encoded once as integer codes. The codes of all dimensions
+are stacked with per-dimension offsets, so one grouped pass yields the
+sufficient statistics (cases, late / tolerance / OTIF-fail counts, order value
+and failed order value) for every member of every dimension. Rate tables in
+the group_table layout are derived from those statistics.
+
+Notes
+Counts use np.bincount. Value sums go through the pandas grouped sum
+(compensated summation, rows in original order), so the results are
+bit-identical to a per-dimension groupby.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Sufficient statistics per member; everything in group_table derives from these.
+STAT_COLS = [
+    "cases",
+    "late_cases",
+    "tol_violation_cases",
+    "otif_fail_cases",
+    "sum_order_value",
+    "sum_order_value_otif_fail",
+]
+COUNT_COLS = STAT_COLS[:4]
+VALUE_COLS = STAT_COLS[4:]
+
+# Upper bound for stacked rows (cases x dimensions) per grouped pass.
+STACK_ROWS = 16_000_000
+
+# Label groupby gives the missing-member group (version dependent: "nan" or NaN).
+MISSING_MEMBER = pd.Index([np.nan], dtype=object).astype(str)[0]
+
+# =============================================================================
+# Encoding
+# =============================================================================
+def encode_dimension(s: pd.Series) -> tuple[np.ndarray, list[str]]:
+    """
+    Integer codes + member labels in groupby(dropna=False, observed=False)
+    order: sorted members (all categories for categoricals), missing last.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy().astype(np.int64)
+        members = list(s.cat.categories.astype(str))
+    else:
+        codes, uniques = pd.factorize(s, sort=True, use_na_sentinel=True)
+        codes = codes.astype(np.int64)
+        members = list(pd.Index(uniques).astype(str))
+
+    missing = codes < 0
+    if missing.any():
+        codes[missing] = len(members)
+        members.append(MISSING_MEMBER)
+    return codes, members
+
+# =============================================================================
+# Statistics
+# =============================================================================
+def case_measures(df: pd.DataFrame) -> tuple[np.ndarray, pd.DataFrame | None]:
+    """0/1 count measures as an (n, 3) matrix, value measures as a frame."""
+    fail = df["IS_OTIF_FAIL"].to_numpy(dtype=bool)
+    counts = np.column_stack([
+        df["IS_LATE"].to_numpy(dtype=bool),
+        df["IS_TOL_VIOLATION"].to_numpy(dtype=bool),
+        fail,
+    ])
+    values = None
+    if "ORDER_VALUE" in df.columns:
+        value = df["ORDER_VALUE"].to_numpy(dtype=float)
+        values = pd.DataFrame({
+            "sum_order_value": value,
+            "sum_order_value_otif_fail": np.where(fail, value, np.nan),  # NaN = skipped
+        })
+    return counts, values
+
+def stacked_pass(counts: np.ndarray, values: pd.DataFrame | None, encoded: list[tuple[np.ndarray, int]]) -> pd.DataFrame:
+    """One grouped pass over the stacked codes of several dimensions."""
+    offsets = np.cumsum([0] + [k for _, k in encoded])
+    keys = np.concatenate([codes + off for (codes, _), off in zip(encoded, offsets)])
+    n_keys = int(offsets[-1])
+
+    out = pd.DataFrame({"cases": np.bincount(keys, minlength=n_keys)})
+    for j, col in enumerate(COUNT_COLS[1:]):
+        w = np.tile(counts[:, j], len(encoded))
+        out[col] = np.bincount(keys, weights=w, minlength=n_keys).astype(np.int64)
+
+    if values is not None:
+        stacked = pd.concat([values] * len(encoded), ignore_index=True)
+        sums = stacked.groupby(keys, sort=True).sum().reindex(np.arange(n_keys), fill_value=0.0)
+        for col in VALUE_COLS:
+            out[col] = sums[col].to_numpy(dtype=float)
+    return out
+
+def dimension_stats(df: pd.DataFrame, dims: list[str]) -> dict[str, pd.DataFrame]:
+    """
+    Sufficient statistics for every member of every dimension in `dims`,
+    indexed by member label. Dimensions are packed into as few grouped
+    passes as STACK_ROWS allows (one pass for typical tables).
+    """
+    counts, values = case_measures(df)
+    encoded = {d: encode_dimension(df[d]) for d in dims}
+
+    per_pass = max(1, STACK_ROWS // max(len(df), 1))
+    out = {}
+    for i in range(0, len(dims), per_pass):
+        batch = dims[i:i + per_pass]
+        stats = stacked_pass(counts, values, [(encoded[d][0], len(encoded[d][1])) for d in batch])
+        start = 0
+        for d in batch:
+            members = encoded[d][1]
+            part = stats.iloc[start:start + len(members)].copy()
+            part.index = pd.Index(members, name="member")
+            out[d] = part
+            start += len(members)
+    return out
+
+def merge_stats(a: pd.DataFrame | None, b: pd.DataFrame, sign: int = 1) -> pd.DataFrame:
+    """
+    a + sign * b for stats frames of one dimension (members aligned by label).
+    Members left with no cases are dropped; missing member sorts last.
+    """
+    if a is None:
+        a = b.iloc[0:0]
+    out = a.add(sign * b, fill_value=0)
+    out[COUNT_COLS] = out[COUNT_COLS].round().astype(np.int64)
+    out = out[out["cases"] > 0]
+    return out.sort_index(na_position="last")
+
+# =============================================================================
+# Rate tables
+# =============================================================================
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+def rate_arrays(stats) -> dict[str, np.ndarray]:
+    """
+    The rates_*.csv measure columns (everything after dimension and member)
+    from a stats frame or a dict of stats arrays.
+    """
+    cases = np.asarray(stats["cases"])
+    out = {
+        "cases": cases,
+        "late_rate_cases": _ratio(stats["late_cases"], cases),
+        "tol_violation_rate_cases": _ratio(stats["tol_violation_cases"], cases),
+        "otif_fail_rate_cases": _ratio(stats["otif_fail_cases"], cases),
+        "otif_fail_cases": np.asarray(stats["otif_fail_cases"]),
+    }
+    if "sum_order_value" in stats:
+        out["sum_order_value"] = np.asarray(stats["sum_order_value"], dtype=float)
+        out["sum_order_value_otif_fail"] = np.asarray(stats["sum_order_value_otif_fail"], dtype=float)
+        out["otif_fail_rate_value"] = _ratio(out["sum_order_value_otif_fail"], out["sum_order_value"])
+    return out
+
+def rates_from_stats(dim: str, stats: pd.DataFrame) -> pd.DataFrame:
+    """Turn sufficient statistics into the group_table / rates_*.csv layout."""
+    return pd.DataFrame({"dimension": dim, "member": stats.index.astype(str), **rate_arrays(stats)})
+
+def rate_tables(df: pd.DataFrame, dims: list[str]) -> dict[str, pd.DataFrame]:
+    return {d: rates_from_stats(d, st) for d, st in dimension_stats(df, dims).items()}
@@ -0,0 +1,143 @@
+"""
+Purpose
+OTIF cube: additive OTIF measures precomputed over a set of dimensions.
+
+The base cuboid holds one row per observed combination of members (integer
+codes per dimension) with the sufficient statistics of otif_agg.STAT_COLS.
+Any rollup to a subset of its dimensions (single dimension = the rates_*.csv
+tables, pairs such as FACTORY x DELIVERY_COMPANY for drill-down) is a grouped
+sum over the cells instead of a new pass over the cases, and is memoised on
+the cube.
+
+Notes
+Counts are exact. Value sums are compensated (Kahan) sums per cell, and
+rollups add the cells the same way, so they can differ from a direct sum
+over the cases in the last floating point digits. The single-dimension
+rollups the rates tables use are therefore taken at build time from
+otif_agg.dimension_stats and are bit-identical to it; a cube read back with
+load_cube rolls them up from its cells.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import (
+    COUNT_COLS, MISSING_MEMBER, STAT_COLS, VALUE_COLS, case_measures, dimension_stats, encode_dimension,
+    rates_from_stats,
+)
+
+MEMBER_SEP = " | "
+DIM_SEP = " x "
+
+class OtifCube(NamedTuple):
+    dims: list[str]
+    members: dict[str, list[str]]  # dimension -> labels, indexed by code
+    cells: pd.DataFrame            # one code column per dimension + STAT_COLS
+    rollups: dict                  # memo: tuple(dims) -> stats frame
+
+# =============================================================================
+# Build
+# =============================================================================
+def _code_dtype(n: int):
+    return np.int8 if n < 2**7 else np.int16 if n < 2**15 else np.int32
+
+def build_cube(df: pd.DataFrame, dims: list[str]) -> OtifCube:
+    """
+    Base cuboid over `dims` in one grouped pass over the cases, with the
+    single-dimension rollups (exact, see Notes) already memoised.
+    """
+    counts, values = case_measures(df)
+    enc = {d: encode_dimension(df[d]) for d in dims}
+
+    radix = [max(len(enc[d][1]), 1) for d in dims]
+    if np.prod(radix, dtype=float) < 2**62:
+        key = np.zeros(len(df), dtype=np.int64)
+        for d, r in zip(dims, radix):
+            key = key * r + enc[d][0]
+        cell, uniq = pd.factorize(key, sort=True)
+    else:  # too many combinations for one int64 key
+        cell, uniq = pd.factorize(pd.MultiIndex.from_arrays([enc[d][0] for d in dims]), sort=True)
+    n_cells = len(uniq)
+
+    cells = pd.DataFrame(index=pd.RangeIndex(n_cells))
+    if isinstance(uniq, pd.MultiIndex):
+        for i, d in enumerate(dims):
+            cells[d] = uniq.get_level_values(i).to_numpy().astype(_code_dtype(len(enc[d][1])))
+    else:
+        rest = np.asarray(uniq, dtype=np.int64)
+        for d, r in reversed(list(zip(dims, radix))):
+            rest, code = np.divmod(rest, r)
+            cells[d] = code.astype(_code_dtype(r))
+        cells = cells[dims]
+
+    cells["cases"] = np.bincount(cell, minlength=n_cells)
+    for j, col in enumerate(COUNT_COLS[1:]):
+        cells[col] = np.bincount(cell, weights=counts[:, j], minlength=n_cells).astype(np.int64)
+    if values is not None:
+        sums = values.groupby(cell, sort=True).sum()
+        for col in VALUE_COLS:
+            cells[col] = sums[col].to_numpy(dtype=float)
+
+    stats_cols = [c for c in STAT_COLS if c in cells.columns]
+    rollups = {(d,): st.loc[st["cases"] > 0, stats_cols] for d, st in dimension_stats(df, dims).items()}
+    return OtifCube(list(dims), {d: enc[d][1] for d in dims}, cells, rollups)
+
+# =============================================================================
+# Rollups
+# =============================================================================
+def rollup(cube: OtifCube, by: list[str]) -> pd.DataFrame:
+    """
+    Stats per member combination of `by` (subset of cube.dims), indexed by
+    member label (single dimension) or by labels joined with MEMBER_SEP.
+    """
+    key = tuple(by)
+    if key in cube.rollups:
+        return cube.rollups[key]
+    missing = [d for d in by if d not in cube.dims]
+    if missing:
+        raise ValueError(f"Cube has no dimensions {missing}; build it with them.")
+
+    stats_cols = [c for c in STAT_COLS if c in cube.cells.columns]
+    grouped = cube.cells.groupby(list(by), sort=True)
+    stats = grouped[stats_cols].sum()
+    labels = [np.asarray(cube.members[d], dtype=object)[stats.index.get_level_values(d)] for d in by]
+    if len(by) == 1:
+        index = pd.Index(labels[0], name="member")
+    else:
+        index = pd.Index([MEMBER_SEP.join(map(str, t)) for t in zip(*labels)], name="member")
+    stats.index = index
+    cube.rollups[key] = stats
+    return stats
+
+def cube_rates(cube: OtifCube, by: list[str]) -> pd.DataFrame:
+    """group_table-shaped rates for a rollup; dimension names joined with DIM_SEP."""
+    return rates_from_stats(DIM_SEP.join(by), rollup(cube, by))
+
+# =============================================================================
+# Persistence
+# =============================================================================
+def save_cube(cube: OtifCube, cube_dir: Path) -> None:
+    cube_dir = Path(cube_dir)
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    cube.cells.to_parquet(cube_dir / "cells.parquet", index=False)
+    members = pd.DataFrame(
+        [(d, code, None if pd.isna(m) else str(m)) for d in cube.dims for code, m in enumerate(cube.members[d])],
+        columns=["dimension", "code", "member"],
+    )
+    members.to_parquet(cube_dir / "members.parquet", index=False)
+
+def load_cube(cube_dir: Path) -> OtifCube:
+    cube_dir = Path(cube_dir)
+    cells = pd.read_parquet(cube_dir / "cells.parquet")
+    members_long = pd.read_parquet(cube_dir / "members.parquet")
+    dims = [c for c in cells.columns if c not in STAT_COLS]
+    members = {}
+    for d in dims:
+        labels = members_long.loc[members_long["dimension"] == d].sort_values("code")["member"]
+        members[d] = [MISSING_MEMBER if pd.isna(m) else m for m in labels]
+    return OtifCube(dims, members, cells, {})
@@ -0,0 +1,110 @@
+"""
+Purpose
+Incremental OTIF aggregation over appended case batches.
+
+The state holds the mergeable sufficient statistics per dimension member (the
+quantities behind group_table, see otif_agg.STAT_COLS) plus a compact case
+ledger: one row per CASE_KEY with its dimension members, OTIF flags and order
+value. A new batch is folded in by subtracting the ledger contribution of
+re-delivered CASE_KEYs and adding the batch statistics, so old raw data is
+never read again. Rate tables come straight from the stored statistics.
+
+Notes
+The state lives in the run folder (state_dir(out_dir)), so every run folder
+folds its own batch history and two reports never share running totals.
+Counts are exact. Value sums are updated by addition/subtraction and can
+differ from a full recompute in the last floating point digits.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+
+from otif_agg import dimension_stats, merge_stats, rates_from_stats
+
+STATE_NAME = ".otif_state"  # folder in the run folder
+
+KEY = "CASE_KEY"
+FLAG_COLS = ["IS_LATE", "IS_TOL_VIOLATION", "IS_OTIF_FAIL"]
+
+class OtifState(NamedTuple):
+    stats: dict[str, pd.DataFrame]  # dimension -> stats indexed by member
+    ledger: pd.DataFrame            # one row per CASE_KEY
+
+def empty_state() -> OtifState:
+    return OtifState({}, pd.DataFrame(columns=[KEY]))
+
+# =============================================================================
+# Merging
+# =============================================================================
+def _ledger_rows(df: pd.DataFrame, dims: list[str]) -> pd.DataFrame:
+    cols = [KEY] + dims + FLAG_COLS + (["ORDER_VALUE"] if "ORDER_VALUE" in df.columns else [])
+    out = df[cols].drop_duplicates(KEY, keep="last").reset_index(drop=True)
+    for d in dims:
+        out[d] = out[d].astype(object).where(out[d].notna())
+    return out
+
+def fold_batch(state: OtifState, batch: pd.DataFrame, dims: list[str]) -> OtifState:
+    """
+    Fold a KPI-engineered case batch into the state. A CASE_KEY that is already
+    in the ledger is replaced: its old contribution is subtracted first.
+    """
+    ledger = state.ledger
+    missing = [d for d in dims if len(ledger) and d not in ledger.columns]
+    if missing:
+        raise ValueError(f"State was built without dimensions {missing}; rebuild it from the full history.")
+
+    rows = _ledger_rows(batch, dims)
+    redelivered = ledger[ledger[KEY].isin(rows[KEY])] if len(ledger) else ledger
+
+    stats = dict(state.stats)
+    new = dimension_stats(rows, dims)
+    old = dimension_stats(redelivered, dims) if len(redelivered) else {}
+    for d in dims:
+        st = merge_stats(stats.get(d), new[d])
+        if d in old:
+            st = merge_stats(st, old[d], sign=-1)
+        stats[d] = st
+
+    if len(ledger):
+        ledger = pd.concat([ledger[~ledger[KEY].isin(rows[KEY])], rows], ignore_index=True)
+    else:
+        ledger = rows
+    return OtifState(stats, ledger)
+
+def state_tables(state: OtifState, dims: list[str]) -> dict[str, pd.DataFrame]:
+    """group_table-shaped rate tables from the stored statistics."""
+    return {d: rates_from_stats(d, state.stats[d]) for d in dims if d in state.stats}
+
+# =============================================================================
+# Persistence
+# =============================================================================
+def state_dir(out_dir: Path) -> Path:
+    """State folder of the run folder `out_dir`."""
+    return Path(out_dir) / STATE_NAME
+
+def save_state(state: OtifState, state_dir: Path) -> None:
+    state_dir = Path(state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    long = [st.rename_axis("member").reset_index().assign(dimension=d) for d, st in state.stats.items()]
+    if long:
+        pd.concat(long, ignore_index=True).to_parquet(state_dir / "stats.parquet", index=False)
+    state.ledger.to_parquet(state_dir / "ledger.parquet", index=False)
+
+def load_state(state_dir: Path) -> OtifState:
+    state_dir = Path(state_dir)
+    if not (state_dir / "ledger.parquet").exists():
+        return empty_state()
+
+    ledger = pd.read_parquet(state_dir / "ledger.parquet")
+    stats = {}
+    if (state_dir / "stats.parquet").exists():
+        long = pd.read_parquet(state_dir / "stats.parquet")
+        for d, st in long.groupby("dimension", sort=False):
+            st = st.drop(columns="dimension").set_index("member")
+            st.index = st.index.astype(object).where(st.index.notna())
+            stats[d] = st.sort_index(na_position="last")
+    return OtifState(stats, ledger)
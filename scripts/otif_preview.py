@@ -0,0 +1,214 @@
+"""
+Purpose
+Fast preview of the rate tables and the ranking from a stratified sample,
+with sampling error bounds and flags for members whose rank is uncertain.
+
+Sampling is threshold (bottom-k) sampling over the raw case chunks: every
+case gets a random key u. It is kept if u is below its threshold
+max(fraction, tau over its members), where tau of a member is the
+(min_per_member + 1)-th smallest key of that member in its dimension. So
+every member of every dimension keeps at least min_per_member cases (all of
+them if it has fewer), on top of a uniform `fraction` of the table. The
+inclusion probability of a kept case is its threshold; SAMPLE_WEIGHT = 1 /
+probability.
+
+Only the sample is cleaned and KPI-engineered. Rates are weighted ratio
+estimates (sum w*y / sum w*x), and each gets a sampling error bound (<rate>_err,
+half-width at rate_ci.CONFIDENCE) from the linearised variance
+sum (1 - pi) / pi^2 * (y - rate * x)^2 / (sum w*x)^2. Members sampled
+completely have a bound of 0. Per dimension, the best and worst rank of each
+member compatible with the bounds give rank_best / rank_worst; they differ
+where the rank is uncertain.
+
+Notes
+The bounds cover the sampling error against the full data only, not the
+binomial noise of small members (see rate_ci.py for that). The raw table is
+still read once in chunks, but only the dimension and KPI input columns are
+read, chunks stay untyped text (dimensions are factorized for the keys), and
+typing, memory and KPI work scale with the sample.
+"""
+
+from __future__ import annotations
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import encode_dimension
+from rate_ci import CONFIDENCE
+
+SAMPLE_FRACTION = 0.02
+MIN_PER_MEMBER = 100
+SEED = 0
+# SeedSequence spawn key of the sampler's stream: generators seeded with the
+# bare SEED (e.g. synth_data.py) draw other uniforms, so keys cannot replay them
+STREAM = 0x6F746966
+WEIGHT = "SAMPLE_WEIGHT"
+
+RATE_RATIOS = {  # rate -> (numerator, denominator) per case
+    "late_rate_cases": ("IS_LATE", None),
+    "tol_violation_rate_cases": ("IS_TOL_VIOLATION", None),
+    "otif_fail_rate_cases": ("IS_OTIF_FAIL", None),
+    "otif_fail_rate_value": ("ORDER_VALUE_OTIF_FAIL", "ORDER_VALUE"),
+}
+RANK_RATE = "otif_fail_rate_cases"
+
+_KEY = "__sample_key"
+
+# =============================================================================
+# Sampling
+# =============================================================================
+class StratifiedSampler:
+    """
+    Streaming threshold sampler: add() raw chunks, then sample(). Memory holds
+    the (min_per_member + 1) smallest keys per member and the candidate rows.
+    """
+
+    def __init__(self, dims: list[str], fraction: float = SAMPLE_FRACTION,
+                 min_per_member: int = MIN_PER_MEMBER, seed: int = SEED):
+        self.dims = dims
+        self.fraction = fraction
+        self.k = min_per_member
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(STREAM,)))
+        self.smallest: dict[str, pd.DataFrame] = {}  # dim -> (member, key) rows, k + 1 per member
+        self.candidates: pd.DataFrame | None = None
+        self.n_cases = 0
+
+    def _tau(self, d: str, labels: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """(k+1)-th smallest key of each row's member; 1.0 while it has fewer."""
+        codes, members = labels
+        kept = self.smallest.get(d)
+        if kept is None:
+            return np.ones(len(codes))
+        nth = kept[kept.groupby("member", sort=False).cumcount().to_numpy() == self.k]
+        tau = dict(zip(nth["member"], nth["key"]))
+        return np.array([tau.get(m, 1.0) for m in members], dtype=float)[codes]
+
+    def _thresholds(self, labels: dict[str, tuple[np.ndarray, np.ndarray]], n: int) -> np.ndarray:
+        t = np.full(n, float(self.fraction))
+        for d, lab in labels.items():
+            t = np.maximum(t, self._tau(d, lab))
+        return np.minimum(t, 1.0)
+
+    @staticmethod
+    def _labels(rows: pd.DataFrame, dims: list[str]) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Per dimension: (member code per row, member labels as str)."""
+        out = {}
+        for d in dims:
+            codes, uniques = pd.factorize(rows[d], use_na_sentinel=False)
+            out[d] = (codes, np.asarray(pd.Index(uniques).astype(str)))
+        return out
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        dims = [d for d in self.dims if d in chunk.columns]
+        self.n_cases += len(chunk)
+        key = self.rng.random(len(chunk))
+        labels = self._labels(chunk, dims)
+        for d in dims:
+            enters = key < self._tau(d, labels[d])  # others cannot be among the k + 1 smallest
+            codes, members = labels[d]
+            new = pd.DataFrame({"member": members[codes[enters]], "key": key[enters]})
+            both = pd.concat([self.smallest.get(d), new], ignore_index=True)
+            both = both.sort_values("key", kind="stable")
+            self.smallest[d] = both[both.groupby("member", sort=False).cumcount().to_numpy() <= self.k]
+
+        chunk = chunk.assign(**{_KEY: key})
+        t = self._thresholds(labels, len(chunk))
+        rows = chunk[key < t]
+        if self.candidates is not None:
+            rows = pd.concat([self.candidates, rows], ignore_index=True)
+            rows = rows[rows[_KEY].to_numpy() < self._thresholds(self._labels(rows, dims), len(rows))]
+        self.candidates = rows.reset_index(drop=True)
+
+    def sample(self) -> pd.DataFrame:
+        """Sampled raw rows with SAMPLE_WEIGHT (1 / inclusion probability)."""
+        if self.candidates is None:
+            raise ValueError("No chunks were added to the sampler.")
+        rows = self.candidates
+        dims = [d for d in self.dims if d in rows.columns]
+        t = self._thresholds(self._labels(rows, dims), len(rows))
+        keep = rows[_KEY].to_numpy() < t
+        out = rows[keep].drop(columns=_KEY).reset_index(drop=True)
+        out[WEIGHT] = 1.0 / t[keep]
+        return out
+
+# =============================================================================
+# Estimates
+# =============================================================================
+def _case_values(sample: pd.DataFrame) -> dict[str, np.ndarray]:
+    cols = {c: sample[c].to_numpy(dtype=float) for c in ["IS_LATE", "IS_TOL_VIOLATION", "IS_OTIF_FAIL"]}
+    if "ORDER_VALUE" in sample.columns:
+        v = np.nan_to_num(sample["ORDER_VALUE"].to_numpy(dtype=float, na_value=np.nan))
+        cols["ORDER_VALUE"] = v
+        cols["ORDER_VALUE_OTIF_FAIL"] = np.where(cols["IS_OTIF_FAIL"] > 0, v, 0.0)
+    return cols
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num, den, out=np.full(len(num), np.nan), where=den != 0)
+
+def preview_table(sample: pd.DataFrame, dim: str, confidence: float = CONFIDENCE) -> pd.DataFrame:
+    """
+    Estimated rates_*.csv columns for `dim` from a weighted, KPI-engineered
+    sample, with <rate>_err bounds and rank columns (see rank_bounds).
+    """
+    codes, members = encode_dimension(sample[dim])
+    k = len(members)
+    w = sample[WEIGHT].to_numpy(dtype=float)
+    # (1 - pi) / pi^2 per case; 0 for cases sampled with certainty
+    var_w = np.maximum(w * (w - 1.0), 0.0)
+    vals = _case_values(sample)
+
+    def total(x: np.ndarray) -> np.ndarray:
+        return np.bincount(codes, weights=w * x, minlength=k)
+
+    ones = np.ones(len(w))
+    est_cases = total(ones)
+    out = pd.DataFrame({
+        "dimension": dim,
+        "member": members,
+        "sample_cases": np.bincount(codes, minlength=k),
+        "cases": np.round(est_cases).astype(np.int64),
+    })
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    for rate, (num, den) in RATE_RATIOS.items():
+        if num not in vals or (den is not None and den not in vals):
+            continue
+        y = vals[num]
+        x = ones if den is None else vals[den]
+        tx = total(x)
+        r = _ratio(total(y), tx)
+        resid = y - np.nan_to_num(r)[codes] * x
+        var = _ratio(np.bincount(codes, weights=var_w * resid**2, minlength=k), tx**2)
+        out[rate] = r
+        out[f"{rate}_err"] = z * np.sqrt(var)
+    out.insert(out.columns.get_loc("otif_fail_rate_cases_err") + 1, "otif_fail_cases",
+               np.round(total(vals["IS_OTIF_FAIL"])).astype(np.int64))
+    if "ORDER_VALUE" in vals:  # before the value rate, as in rates_*.csv
+        at = out.columns.get_loc("otif_fail_rate_value")
+        out.insert(at, "sum_order_value", total(vals["ORDER_VALUE"]))
+        out.insert(at + 1, "sum_order_value_otif_fail", total(vals["ORDER_VALUE_OTIF_FAIL"]))
+    return rank_bounds(out)
+
+def rank_bounds(tbl: pd.DataFrame, rate: str = RANK_RATE) -> pd.DataFrame:
+    """
+    rank (1 = highest rate), rank_best / rank_worst over all rates within
+    +-err, and rank_uncertain where they differ; members without a rate last.
+    """
+    r = tbl[rate].to_numpy(dtype=float)
+    err = np.nan_to_num(tbl[f"{rate}_err"].to_numpy(dtype=float))
+    ok = ~np.isnan(r)
+    lo, hi = r[ok] - err[ok], r[ok] + err[ok]
+    out = tbl.copy()
+    order = (-np.where(ok, r, -np.inf)).argsort(kind="stable")
+    rank = np.empty(len(r), dtype=np.int64)
+    rank[order] = np.arange(1, len(r) + 1)
+    best = np.full(len(r), np.nan)
+    worst = np.full(len(r), np.nan)
+    best[ok] = 1 + (lo[None, :] > hi[:, None]).sum(axis=1)
+    worst[ok] = ok.sum() - (hi[None, :] < lo[:, None]).sum(axis=1)
+    out["rank"] = rank
+    out["rank_best"] = pd.array(best, dtype="Int64")
+    out["rank_worst"] = pd.array(worst, dtype="Int64")
+    out["rank_uncertain"] = ok & (best != worst)
+    return out
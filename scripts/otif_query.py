@@ -0,0 +1,327 @@
+"""
+Purpose
+In-process OTIF query service with bitmap indexes (filter-bar style slicing).
+
+The KPI-engineered case table is indexed once: one packed bitmap (uint64
+words, 1 bit per case) per dimension member and per OTIF flag. For grouping,
+every case also gets a cell code per dimension (member code * 8 + its three
+flag bits). A filter is evaluated as word-wise AND / OR / NOT over bitmaps;
+the matching cases' cell codes go through one counting and one
+value-weighted bincount, which yields every group_table statistic.
+
+Filters are either a filter-bar dict ({dimension: [members]}: OR inside a
+dimension, AND across dimensions) or an expression of nested tuples/lists:
+("member", dim, value), ("flag", name), ("and", ...), ("or", ...), ("not", x).
+serve() exposes the same query as JSON over HTTP on localhost.
+
+Every evaluated filter is cached (LRU, QUERY_CACHE_SIZE filters and at most
+QUERY_CACHE_ROWS cached positions) with the positions of its cases, or of the
+cases it excludes when it matches more than half the table (the statistics
+are then the cached full-table totals minus the excluded cases). The grids
+per group_by are cached with it, so a repeated filter-bar query costs no pass
+over the cases. aggregate() returns the statistics as arrays; query() adds
+the group_table frame on top.
+
+Notes
+Value sums use np.bincount and can differ from group_table in the last
+floating point digits. Counts are exact.
+A first (uncached) query of a filter costs one pass over min(matches,
+n - matches) cases, so it is not sub-10 ms at every size. Measured with 3M
+cases (aggregate, first / repeated): 80k matches 8-9 / 0.1 ms, 600k or 2.4M
+matches 16-20 / 0.1 ms, 1.5M matches (half the table) 32-35 / 0.1 ms.
+query() adds about 2 ms for the frame.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import encode_dimension, rate_arrays, rates_from_stats
+
+# flag -> (bit in the cell code, stats column)
+FLAG_BITS = {
+    "IS_LATE": (1, "late_cases"),
+    "IS_TOL_VIOLATION": (2, "tol_violation_cases"),
+    "IS_OTIF_FAIL": (4, "otif_fail_cases"),
+}
+
+ALL = "ALL"
+
+QUERY_CACHE_SIZE = 256          # filters kept in the selection cache
+QUERY_CACHE_ROWS = 16_000_000   # case positions kept over all cached filters
+
+class BitmapIndex(NamedTuple):
+    n: int                                # cases
+    members: dict[str, list[str]]         # dimension -> labels by code
+    bitmaps: dict[str, np.ndarray]        # dimension -> (n_members, n_words) uint64
+    flags: dict[str, np.ndarray]          # flag -> (n_words,) uint64
+    cells: dict[str | None, np.ndarray]   # dimension (None = all) -> member code * 8 + flag bits
+    order_value: np.ndarray | None        # float per case, NaN as 0
+    selections: OrderedDict               # LRU: frozen filter -> Selection
+    totals: dict                          # group_by -> full-table grids
+
+class Selection(NamedTuple):
+    rows: np.ndarray   # positions of the matching cases (of the excluded ones if complement)
+    complement: bool
+    grids: dict        # group_by -> (counts, values) grids
+
+class QueryResult(NamedTuple):
+    group_by: str | None
+    members: np.ndarray            # labels of the members with cases
+    stats: dict[str, np.ndarray]   # otif_agg.STAT_COLS -> value per member
+
+# =============================================================================
+# Bitmaps
+# =============================================================================
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """bool per case -> uint64 words (little-endian bit order)."""
+    packed = np.packbits(bits, bitorder="little")
+    packed = np.pad(packed, (0, -len(packed) % 8))
+    return packed.view(np.uint64)
+
+def unpack(words: np.ndarray, n: int) -> np.ndarray:
+    return np.unpackbits(words.view(np.uint8), count=n, bitorder="little").view(bool)
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray) -> int:
+        return int(_POP8[words.view(np.uint8)].sum())
+
+def build_index(df: pd.DataFrame, dims: list[str]) -> BitmapIndex:
+    """Index a KPI-engineered case table (needs the IS_* flags)."""
+    n = len(df)
+    flag_bits = np.zeros(n, dtype=np.int64)
+    flags = {}
+    for f, (bit, _) in FLAG_BITS.items():
+        if f in df.columns:
+            v = df[f].to_numpy(dtype=bool)
+            flags[f] = _pack(v)
+            flag_bits += bit * v
+
+    members, bitmaps, cells = {}, {}, {None: flag_bits}
+    for d in dims:
+        c, labels = encode_dimension(df[d])
+        members[d] = labels
+        cells[d] = c * 8 + flag_bits
+        order = np.argsort(c, kind="stable")
+        bounds = np.searchsorted(c[order], np.arange(len(labels) + 1))
+        rows = []
+        bits = np.zeros(n, dtype=bool)
+        for m in range(len(labels)):
+            idx = order[bounds[m]:bounds[m + 1]]
+            bits[idx] = True
+            rows.append(_pack(bits))
+            bits[idx] = False
+        bitmaps[d] = np.stack(rows) if rows else np.zeros((0, len(_pack(bits))), dtype=np.uint64)
+
+    value = np.nan_to_num(df["ORDER_VALUE"].to_numpy(dtype=float)) if "ORDER_VALUE" in df.columns else None
+    return BitmapIndex(n, members, bitmaps, flags, cells, value, OrderedDict(), {})
+
+# =============================================================================
+# Filters
+# =============================================================================
+def all_cases(index: BitmapIndex) -> np.ndarray:
+    return _pack(np.ones(index.n, dtype=bool))
+
+def _member_bitmap(index: BitmapIndex, dim: str, value: str) -> np.ndarray:
+    if dim not in index.members:
+        raise KeyError(f"Unknown dimension {dim!r}; indexed: {list(index.members)}")
+    labels = index.members[dim]
+    hit = [i for i, m in enumerate(labels) if str(m) == str(value)]
+    if not hit:
+        return np.zeros(index.bitmaps[dim].shape[1], dtype=np.uint64)
+    return index.bitmaps[dim][hit[0]]
+
+def evaluate(index: BitmapIndex, expr) -> np.ndarray:
+    """Bitmap of the cases matching an expression (see module docstring)."""
+    op, *args = expr
+    if op == "member":
+        return _member_bitmap(index, *args)
+    if op == "flag":
+        if args[0] not in index.flags:
+            raise KeyError(f"Unknown flag {args[0]!r}; indexed: {list(index.flags)}")
+        return index.flags[args[0]]
+    if op == "not":
+        return ~evaluate(index, args[0]) & all_cases(index)
+    if op in ("and", "or"):
+        parts = [evaluate(index, a) for a in args]
+        if not parts:
+            return all_cases(index) if op == "and" else np.zeros_like(all_cases(index))
+        return np.bitwise_and.reduce(parts) if op == "and" else np.bitwise_or.reduce(parts)
+    raise ValueError(f"Unknown filter operator {op!r}")
+
+def filter_expr(filters: dict[str, list[str]] | None = None, flags: dict[str, bool] | None = None):
+    """Filter-bar dict -> expression: OR within a dimension, AND across."""
+    terms = [("or", *[("member", d, m) for m in values]) for d, values in (filters or {}).items()]
+    for f, on in (flags or {}).items():
+        terms.append(("flag", f) if on else ("not", ("flag", f)))
+    return ("and", *terms)
+
+# =============================================================================
+# Query
+# =============================================================================
+def count(index: BitmapIndex, expr) -> int:
+    return popcount(evaluate(index, expr))
+
+def _freeze(expr):
+    """Hashable cache key; JSON filters arrive with lists instead of tuples."""
+    return tuple(_freeze(a) for a in expr) if isinstance(expr, (list, tuple)) else expr
+
+def clear_cache(index: BitmapIndex) -> None:
+    index.selections.clear()
+    index.totals.clear()
+
+def select(index: BitmapIndex, expr) -> Selection:
+    """Cached selection of the cases matching `expr`."""
+    key = _freeze(expr)
+    sel = index.selections.get(key)
+    if sel is not None:
+        index.selections.move_to_end(key)
+        return sel
+
+    words = evaluate(index, expr)
+    complement = popcount(words) > index.n // 2
+    if complement:
+        words = ~words  # padding bits are cut off by unpack
+    rows = np.flatnonzero(unpack(words, index.n))
+    sel = Selection(rows.astype(np.int32) if index.n < 2**31 else rows, complement, {})
+
+    cache = index.selections
+    cache[key] = sel
+    while len(cache) > 1 and (len(cache) > QUERY_CACHE_SIZE
+                              or sum(len(s.rows) for s in cache.values()) > QUERY_CACHE_ROWS):
+        cache.popitem(last=False)
+    return sel
+
+def _grids(index: BitmapIndex, group_by: str | None, rows: np.ndarray | None = None):
+    """
+    Case count and order value grids over the cases at `rows` (all if None):
+    one row per member, one column per flag bit combination.
+    """
+    cell, value = index.cells[group_by], index.order_value
+    if rows is not None:
+        cell = cell[rows]
+        value = value[rows] if value is not None else None
+    size = (1 if group_by is None else len(index.members[group_by])) * 8
+    n = np.bincount(cell, minlength=size).reshape(-1, 8)
+    v = None if value is None else np.bincount(cell, weights=value, minlength=size).reshape(-1, 8)
+    return n, v
+
+def _totals(index: BitmapIndex, group_by: str | None):
+    if group_by not in index.totals:
+        index.totals[group_by] = _grids(index, group_by)
+    return index.totals[group_by]
+
+_COMBOS = np.arange(8)
+
+def aggregate(index: BitmapIndex, where=None, group_by: str | None = None, **filter_bar) -> QueryResult:
+    """
+    Statistics per member of `group_by` (members with cases only) for the
+    cases matching `where` (an expression) or the filter bar (filters=...,
+    flags=...), as arrays.
+    """
+    if group_by is not None and group_by not in index.members:
+        raise KeyError(f"Unknown dimension {group_by!r}; indexed: {list(index.members)}")
+    expr = where if where is not None else filter_expr(**filter_bar)
+    sel = select(index, expr)
+    grids = sel.grids.get(group_by)
+    if grids is None:
+        n, v = _grids(index, group_by, sel.rows)
+        if sel.complement:
+            total_n, total_v = _totals(index, group_by)
+            n = total_n - n
+            v = None if v is None else total_v - v
+        grids = sel.grids[group_by] = (n, v)
+
+    n, v = grids
+    cases = n.sum(axis=1)
+    keep = cases > 0
+    n = n[keep]
+    stats = {"cases": cases[keep]}
+    for f, (bit, col) in FLAG_BITS.items():
+        stats[col] = n[:, (_COMBOS & bit) > 0].sum(axis=1)
+    if v is not None:
+        v = v[keep]
+        stats["sum_order_value"] = v.sum(axis=1)
+        stats["sum_order_value_otif_fail"] = v[:, (_COMBOS & 4) > 0].sum(axis=1)
+    labels = [ALL] if group_by is None else index.members[group_by]
+    return QueryResult(group_by, np.asarray(labels, dtype=object)[keep], stats)
+
+def query(index: BitmapIndex, where=None, group_by: str | None = None, **filter_bar) -> pd.DataFrame:
+    """
+    group_table-shaped rates for the cases matching `where` (an expression)
+    or the filter bar (filters=..., flags=...), per member of `group_by`.
+    """
+    r = aggregate(index, where, group_by, **filter_bar)
+    stats = pd.DataFrame(r.stats, index=pd.Index(r.members, name="member"))
+    return rates_from_stats(group_by or ALL, stats)
+
+def records(result: QueryResult) -> list[dict]:
+    """JSON-ready rows in the group_table layout (NaN rates as None)."""
+    cols = {"member": result.members, **rate_arrays(result.stats)}
+    dim = result.group_by or ALL
+    out = []
+    for i in range(len(result.members)):
+        row = {"dimension": dim}
+        for c, a in cols.items():
+            x = a[i].item() if hasattr(a[i], "item") else a[i]
+            row[c] = None if isinstance(x, float) and x != x else x
+        out.append(row)
+    return out
+
+# =============================================================================
+# HTTP (localhost)
+# =============================================================================
+def _handler(index: BitmapIndex):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/dims":
+                self._send(200, {d: [str(m) for m in ms] for d, ms in index.members.items()})
+            else:
+                self._send(404, {"error": "GET /dims or POST /query"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/query":
+                self._send(404, {"error": "POST /query"})
+                return
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                out = aggregate(index, where=req.get("where"), group_by=req.get("group_by"),
+                                filters=req.get("filters"), flags=req.get("flags"))
+                self._send(200, records(out))
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return Handler
+
+def serve(index: BitmapIndex, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """Serve POST /query and GET /dims until interrupted."""
+    server = ThreadingHTTPServer((host, port), _handler(index))
+    print(f"OTIF query service on http://{host}:{port} (POST /query, GET /dims)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,184 @@
+"""
+Purpose
+OTIF trends: group_table measures per time bucket x dimension member, with
+trailing-window (rolling) rates, for the Control phase.
+
+Cases are bucketed by a date column (PROMISED_DATE or DELIVERED_DATE) into
+weeks (starting Monday) or calendar months. Every dimension's member codes are
+combined with the bucket number, so one grouped pass (otif_agg.stacked_pass)
+yields the sufficient statistics (otif_agg.STAT_COLS) of every bucket x
+member of every dimension. Cases without a date are left out.
+
+Rolling windows over the trailing N buckets are maintained incrementally by
+RollingStats: each new bucket's statistics are added and the bucket leaving
+the window is subtracted, vectorised over members, instead of re-summing the
+window for every bucket. Empty buckets count as zero, so a window always
+spans N calendar buckets.
+
+Notes
+trend_stats frames are indexed by (bucket, member) and hold observed
+combinations only; stats of separate batches or chunks fold with
+otif_agg.merge_stats. Rolling value sums are updated by addition/subtraction
+and can differ from a direct window sum in the last floating point digits;
+counts are exact.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import STACK_ROWS, STAT_COLS, case_measures, encode_dimension, rates_from_stats, stacked_pass
+
+# bucket -> pandas frequency of the bucket start dates
+FREQS = {"week": "W-MON", "month": "MS"}
+RATE_COLS = ["late_rate_cases", "tol_violation_rate_cases", "otif_fail_rate_cases", "otif_fail_rate_value"]
+
+# =============================================================================
+# Buckets
+# =============================================================================
+def bucket_numbers(dates: pd.Series, freq: str) -> np.ndarray:
+    """Integer bucket per date (weeks or months since 1970), -1 where missing."""
+    if freq not in FREQS:
+        raise ValueError(f"Unknown trend bucket {freq!r}; use one of {list(FREQS)}.")
+    d = pd.to_datetime(dates, errors="coerce")
+    missing = d.isna().to_numpy()
+    v = d.to_numpy(dtype="datetime64[ns]")
+    if freq == "week":
+        days = v.astype("datetime64[D]").astype(np.int64)
+        out = (days + 3) // 7  # 1970-01-01 is a Thursday; weeks start on Monday
+    else:
+        out = v.astype("datetime64[M]").astype(np.int64)
+    out[missing] = -1
+    return out
+
+def bucket_starts(numbers: np.ndarray, freq: str) -> pd.DatetimeIndex:
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if freq == "week":
+        return pd.DatetimeIndex((numbers * 7 - 3).astype("datetime64[D]"))
+    return pd.DatetimeIndex(numbers.astype("datetime64[M]").astype("datetime64[D]"))
+
+# =============================================================================
+# Statistics per bucket x member
+# =============================================================================
+def trend_stats(df: pd.DataFrame, dims: list[str], date_col: str, freq: str = "week") -> dict[str, pd.DataFrame]:
+    """
+    Sufficient statistics per (bucket, member) for every dimension in `dims`,
+    indexed by bucket start date and member label (observed combinations).
+    """
+    b = bucket_numbers(df[date_col], freq)
+    keep = b >= 0
+    if not keep.any():
+        return {}
+    b = b[keep]
+    lo = int(b.min())
+    n_buckets = int(b.max()) - lo + 1
+    starts = bucket_starts(np.arange(lo, lo + n_buckets), freq)
+
+    counts, values = case_measures(df)
+    counts = counts[keep]
+    if values is not None:
+        values = values[keep].reset_index(drop=True)
+    encoded = {}
+    for d in dims:
+        codes, members = encode_dimension(df[d])
+        encoded[d] = (codes[keep], members)
+    per_pass = max(1, STACK_ROWS // len(b))
+    out = {}
+    for i in range(0, len(dims), per_pass):
+        batch = dims[i:i + per_pass]
+        keys = [((b - lo) * len(encoded[d][1]) + encoded[d][0], n_buckets * len(encoded[d][1])) for d in batch]
+        stats = stacked_pass(counts, values, keys)
+        start = 0
+        for d in batch:
+            members = encoded[d][1]
+            part = stats.iloc[start:start + n_buckets * len(members)].copy()
+            part.index = pd.MultiIndex.from_product([starts, members], names=["bucket", "member"])
+            out[d] = part[part["cases"] > 0].copy()
+            start += n_buckets * len(members)
+    return out
+
+# =============================================================================
+# Rolling windows
+# =============================================================================
+class RollingStats:
+    """
+    Trailing-window sums over a stream of per-bucket statistics arrays (any
+    shape, e.g. members x STAT_COLS): push() adds the new bucket, subtracts
+    the one that left the window and returns the window sums.
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError("Rolling window must span at least one bucket.")
+        self.window = window
+        self.buckets: deque[np.ndarray] = deque()
+        self.total: np.ndarray | None = None
+
+    def push(self, bucket: np.ndarray) -> np.ndarray:
+        bucket = np.asarray(bucket, dtype=float)
+        if self.total is None:
+            self.total = np.zeros_like(bucket)
+        self.total += bucket
+        self.buckets.append(bucket)
+        if len(self.buckets) > self.window:
+            self.total -= self.buckets.popleft()
+        return self.total.copy()
+
+def dense_stats(stats: pd.DataFrame, freq: str) -> tuple[pd.DatetimeIndex, pd.Index, np.ndarray]:
+    """(every bucket in range, members, array buckets x members x stat columns), zeros where empty."""
+    cols = [c for c in STAT_COLS if c in stats.columns]
+    wide = stats[cols].unstack("member", fill_value=0)
+    buckets = pd.date_range(wide.index.min(), wide.index.max(), freq=FREQS[freq])
+    wide = wide.reindex(buckets, fill_value=0)
+    members = wide.columns.get_level_values("member").unique()
+    arr = wide.to_numpy(dtype=float).reshape(len(buckets), len(cols), len(members)).transpose(0, 2, 1)
+    return buckets, members, arr
+
+def _flat_stats(arr: np.ndarray, members: pd.Index, cols: list[str]) -> pd.DataFrame:
+    """Stacked buckets x members array -> stats frame indexed by member."""
+    flat = pd.DataFrame(arr.reshape(-1, len(cols)), columns=cols)
+    for c in cols[:4]:
+        flat[c] = flat[c].round().astype(np.int64)
+    flat.index = pd.Index(np.tile(members, arr.shape[0]), name="member")
+    return flat
+
+def trend_table(dim: str, stats: pd.DataFrame, freq: str, windows: Sequence[int]) -> pd.DataFrame:
+    """
+    Long trend table: one row per bucket x member (buckets with cases or with
+    cases in a window), the rates_*.csv columns per bucket, then per window w
+    cases_roll<w> and the rates over the trailing w buckets (<rate>_roll<w>).
+    """
+    cols = [c for c in STAT_COLS if c in stats.columns]
+    buckets, members, arr = dense_stats(stats, freq)
+    out = rates_from_stats(dim, _flat_stats(arr, members, cols))
+    out.insert(2, "bucket", np.repeat(buckets.date, len(members)))
+    active = arr[:, :, 0].reshape(-1) > 0
+
+    for w in windows:
+        roll = RollingStats(w)
+        rolled = np.stack([roll.push(arr[t]) for t in range(len(buckets))])
+        rates = rates_from_stats(dim, _flat_stats(rolled, members, cols))
+        out[f"cases_roll{w}"] = rates["cases"].to_numpy()
+        for c in RATE_COLS:
+            if c in rates.columns:
+                out[f"{c}_roll{w}"] = rates[c].to_numpy()
+        active |= rolled[:, :, 0].reshape(-1) > 0
+
+    out = out[active]
+    return out.sort_values(["member", "bucket"], kind="stable").reset_index(drop=True)
+
+def trend_tables(
+    df: pd.DataFrame,
+    dims: list[str],
+    date_col: str,
+    freq: str = "week",
+    windows: Sequence[int] = (4, 13),
+) -> dict[str, pd.DataFrame]:
+    """{dimension: trend_table} for the dimensions of `dims` present in `df`."""
+    present = [d for d in dims if d in df.columns]
+    stats = trend_stats(df, present, date_col, freq) if date_col in df.columns else {}
+    return {d: trend_table(d, st, freq, windows) for d, st in stats.items()}
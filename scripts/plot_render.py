@@ -0,0 +1,65 @@
+"""
+Purpose
+Rendering stage for the report plots.
+
+Plots are described as specs (plot function + keyword arguments) and drawn on
+a process pool with the Agg backend. Each worker applies the slide style once
+on start-up, so every PNG is rendered with the same rcParams and the result is
+byte-identical to a serial run. A failing plot is reported on its own and
+does not stop the others.
+"""
+
+from __future__ import annotations
+
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+class PlotSpec(NamedTuple):
+    name: str                  # used in error reports (usually the PNG name)
+    fn: Callable[..., None]    # module-level plot function, e.g. barh_rate
+    kwargs: dict
+
+def default_workers() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
+
+def _init_worker(style: Callable[[], None] | None) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    if style is not None:
+        style()
+
+def _render_one(spec: PlotSpec) -> tuple[str, str | None]:
+    try:
+        spec.fn(**spec.kwargs)
+        return spec.name, None
+    except Exception:
+        import matplotlib.pyplot as plt
+        plt.close("all")
+        return spec.name, traceback.format_exc()
+
+def render_plots(
+    specs: list[PlotSpec],
+    workers: int | None = None,
+    style: Callable[[], None] | None = None,
+) -> dict[str, str]:
+    """
+    Render all specs and return {plot name: traceback} for the ones that failed.
+    workers <= 1 renders in this process; `style` is called once per worker.
+    """
+    if workers is None:
+        workers = default_workers()
+
+    if workers <= 1 or len(specs) <= 1:
+        _init_worker(style)
+        results = [_render_one(s) for s in specs]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(specs)),
+            initializer=_init_worker,
+            initargs=(style,),
+        ) as pool:
+            results = list(pool.map(_render_one, specs))
+
+    return {name: err for name, err in results if err is not None}
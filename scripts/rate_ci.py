@@ -0,0 +1,145 @@
+"""
+Purpose
+Confidence intervals for the group_table rates, so that members with few
+cases (e.g. 1 case at 100% fail rate) are not read as hot spots.
+
+Case rates (late, tolerance violation, OTIF fail) get a closed-form Wilson
+interval and a bootstrap interval. A case-rate bootstrap resample of a
+member is a binomial draw, so all members and resamples come from one
+(resamples x members) rng.binomial matrix. The value-weighted fail rate is
+bootstrapped on the cases themselves: resample indices are drawn as
+(resamples x cases) matrices per member, in blocks. Members above
+BOOT_MAX_CASES use the normal approximation of the ratio instead, which is
+where the bootstrap distribution is normal anyway.
+
+Notes
+Intervals are percentile intervals at CONFIDENCE. The RNG is seeded
+(SEED), so reruns give identical tables.
+"""
+
+from __future__ import annotations
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import encode_dimension
+
+CONFIDENCE = 0.95
+RESAMPLES = 2000
+BOOT_MAX_CASES = 5000          # larger members: normal approximation for the value rate
+BLOCK_ELEMENTS = 4_000_000     # resample matrix elements drawn at once
+SEED = 0
+
+CASE_RATES = ["late_rate_cases", "tol_violation_rate_cases", "otif_fail_rate_cases"]
+VALUE_RATE = "otif_fail_rate_value"
+
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+# =============================================================================
+# Case rates
+# =============================================================================
+def wilson_interval(k: np.ndarray, n: np.ndarray, confidence: float = CONFIDENCE) -> tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for k successes out of n (NaN where n == 0)."""
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = _z(confidence)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = k / n
+        denom = 1 + z**2 / n
+        center = (p + z**2 / (2 * n)) / denom
+        half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    lo, hi = center - half, center + half
+    empty = n == 0
+    return np.where(empty, np.nan, np.clip(lo, 0, 1)), np.where(empty, np.nan, np.clip(hi, 0, 1))
+
+def binomial_bootstrap(k: np.ndarray, n: np.ndarray, rng: np.random.Generator,
+                       resamples: int = RESAMPLES, confidence: float = CONFIDENCE) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap of k/n for all members at once."""
+    n = np.asarray(n, dtype=np.int64)
+    p = np.divide(k, n, out=np.zeros(len(n)), where=n > 0)
+    draws = rng.binomial(n, p, size=(resamples, len(n))) / np.maximum(n, 1)
+    a = (1 - confidence) / 2
+    lo, hi = np.quantile(draws, [a, 1 - a], axis=0)
+    return np.where(n > 0, lo, np.nan), np.where(n > 0, hi, np.nan)
+
+# =============================================================================
+# Value-weighted rate
+# =============================================================================
+def _value_bootstrap(v: np.ndarray, fv: np.ndarray, rng: np.random.Generator,
+                     resamples: int, confidence: float) -> tuple[float, float]:
+    """Case resampling of sum(fv) / sum(v) for one member."""
+    n = len(v)
+    rows = max(1, BLOCK_ELEMENTS // n)
+    ratios = []
+    for start in range(0, resamples, rows):
+        idx = rng.integers(0, n, size=(min(rows, resamples - start), n))
+        total = v[idx].sum(axis=1)
+        ratios.append(np.divide(fv[idx].sum(axis=1), total, out=np.full(len(total), np.nan), where=total != 0))
+    a = (1 - confidence) / 2
+    lo, hi = np.nanquantile(np.concatenate(ratios), [a, 1 - a])
+    return lo, hi
+
+def value_rate_interval(df: pd.DataFrame, dim: str, rng: np.random.Generator,
+                        resamples: int = RESAMPLES, confidence: float = CONFIDENCE) -> pd.DataFrame:
+    """Interval of the value-weighted OTIF fail rate per member of `dim`."""
+    codes, members = encode_dimension(df[dim])
+    v = np.nan_to_num(df["ORDER_VALUE"].to_numpy(dtype=float))
+    fv = np.where(df["IS_OTIF_FAIL"].to_numpy(dtype=bool), v, 0.0)
+    k = len(members)
+
+    n = np.bincount(codes, minlength=k)
+    s = np.bincount(codes, weights=v, minlength=k)
+    f = np.bincount(codes, weights=fv, minlength=k)
+    r = np.divide(f, s, out=np.full(k, np.nan), where=s != 0)
+
+    # Normal approximation of a ratio estimator: var = sum(v_i^2 (f_i - r)^2) / S^2
+    fail = fv != 0
+    q_fail = np.bincount(codes[fail], weights=v[fail] ** 2, minlength=k)
+    q_ok = np.bincount(codes[~fail], weights=v[~fail] ** 2, minlength=k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        se = np.sqrt(q_fail * (1 - r) ** 2 + q_ok * r**2) / s
+    z = _z(confidence)
+    lo, hi = np.clip(r - z * se, 0, 1), np.clip(r + z * se, 0, 1)
+
+    order = np.argsort(codes, kind="stable")
+    bounds = np.r_[0, np.cumsum(n)]
+    for m in np.flatnonzero((n > 0) & (n <= BOOT_MAX_CASES)):
+        idx = order[bounds[m]:bounds[m + 1]]
+        lo[m], hi[m] = _value_bootstrap(v[idx], fv[idx], rng, resamples, confidence)
+
+    return pd.DataFrame({f"{VALUE_RATE}_boot_lo": lo, f"{VALUE_RATE}_boot_hi": hi},
+                        index=pd.Index(pd.Index(members).astype(str), name="member"))
+
+# =============================================================================
+# Rate tables
+# =============================================================================
+def add_intervals(
+    tbl: pd.DataFrame,
+    df: pd.DataFrame | None = None,
+    dim: str | None = None,
+    resamples: int = RESAMPLES,
+    confidence: float = CONFIDENCE,
+    seed: int = SEED,
+) -> pd.DataFrame:
+    """
+    group_table + <rate>_wilson_lo/_hi and <rate>_boot_lo/_hi for the case
+    rates. With the case table (`df`, `dim`), also the bootstrap interval of
+    the value-weighted fail rate.
+    """
+    rng = np.random.default_rng(seed)
+    out = tbl.copy()
+    n = out["cases"].to_numpy()
+    for rate in CASE_RATES:
+        k = np.rint(out[rate].fillna(0).to_numpy() * n)
+        out[f"{rate}_wilson_lo"], out[f"{rate}_wilson_hi"] = wilson_interval(k, n, confidence)
+        out[f"{rate}_boot_lo"], out[f"{rate}_boot_hi"] = binomial_bootstrap(k, n, rng, resamples, confidence)
+
+    if df is not None and dim is not None and VALUE_RATE in out.columns:
+        ci = value_rate_interval(df, dim, rng, resamples, confidence)
+        ci = ci.reindex(out["member"].astype(str))
+        for c in ci.columns:
+            out[c] = ci[c].to_numpy()
+    return out
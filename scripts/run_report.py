@@ -0,0 +1,181 @@
+"""
+Purpose
+Stage-level instrumentation for the report pipeline: wall time, CPU time,
+memory and row counts per stage (and per dimension), written as a JSON run
+report next to the outputs.
+
+Stages are marked with `with stage("engineer_kpis") as s: ...; s.rows = n`.
+They only record while a report is active (`with recording(path): ...`);
+otherwise stage() returns one shared no-op object, so instrumented code
+costs a function call per stage when reporting is off. Stages nest; a
+record's "stage" is its path ("report/render_plots"), per thread.
+
+Memory per stage: rss_mb (resident set after the stage) and peak_rss_mb
+(process high-water mark so far; a stage that raised it holds the new peak).
+trace_memory=True adds traced_peak_mb, the exact Python/numpy allocation peak
+within the stage (tracemalloc, slows the run noticeably; stages running
+concurrently share one tracemalloc peak).
+
+Notes
+Stages listed in `profile` are run under cProfile and dumped to
+<profile_dir>/<stage>.prof (view with snakeviz or pstats). For sampling
+profilers (py-spy record -- python 02c_explore.py), the stages are named
+functions of 02c_explore.py, so they show up as such in the flame graph.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+_active: RunReport | None = None
+
+# =============================================================================
+# Memory
+# =============================================================================
+def rss_mb() -> float | None:
+    """Current resident set size (Linux /proc, else psutil if installed)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2**20
+
+def peak_rss_mb() -> float | None:
+    """Process high-water mark (None on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10  # bytes on macOS, KiB on Linux
+
+# =============================================================================
+# Stages
+# =============================================================================
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.rows = None  # shared instance: drop what the caller set
+
+_NULL = _NullStage()
+
+class _Stage:
+    def __init__(self, report: RunReport, name: str, rows: int | None, dimension: str | None):
+        self.report, self.name, self.rows, self.dimension = report, name, rows, dimension
+        self.profiler = None
+        self.traced_peak = 0  # peaks of nested stages (their reset_peak hides them)
+
+    def __enter__(self):
+        r = self.report
+        stack = r._stack()
+        stack.append(self)
+        self.path = "/".join(s.name for s in stack)
+        if self.name in r.profile and not r._profiling:
+            r._profiling = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if r.trace_memory:
+            self.peak_before = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        r = self.report
+        if self.profiler is not None:
+            self.profiler.disable()
+            r._profiling = False
+            r.profile_dir.mkdir(parents=True, exist_ok=True)
+            self.profiler.dump_stats(r.profile_dir / f"{self.path.replace('/', '.')}.prof")
+        rec = {
+            "stage": self.path,
+            "dimension": self.dimension,
+            "rows": None if self.rows is None else int(self.rows),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if r.trace_memory:
+            self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            rec["traced_peak_mb"] = self.traced_peak / 2**20
+            stack = r._stack()
+            if len(stack) > 1:
+                parent = stack[-2]
+                parent.traced_peak = max(parent.traced_peak, self.peak_before, self.traced_peak)
+        if exc_type is not None:
+            rec["error"] = exc_type.__name__
+        r.stages.append(rec)
+        r._stack().pop()
+
+class RunReport:
+    def __init__(self, profile: list[str] | None = None, profile_dir: Path | None = None,
+                 trace_memory: bool = False):
+        self.profile = set(profile or [])
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else Path("profiles")
+        self.trace_memory = trace_memory
+        self.stages: list[dict] = []
+        self.meta: dict = {}
+        self._local = threading.local()  # stage nesting per thread (see stage_dag.py)
+        self._profiling = False
+
+    def _stack(self) -> list[_Stage]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def to_dict(self) -> dict:
+        return {**self.meta, "stages": self.stages}
+
+def stage(name: str, rows: int | None = None, dimension: str | None = None):
+    """Context manager for one stage; a no-op unless a report is recording."""
+    if _active is None:
+        return _NULL
+    return _Stage(_active, name, rows, dimension)
+
+@contextmanager
+def recording(
+    path: Path,
+    profile: list[str] | None = None,
+    trace_memory: bool = False,
+    meta: dict | None = None,
+):
+    """Record all stages of the block and write the JSON report to `path`."""
+    global _active
+    path = Path(path)
+    report = RunReport(profile, path.parent / "profiles", trace_memory)
+    report.meta = {"started": datetime.now().isoformat(timespec="seconds"), "argv": sys.argv, **(meta or {})}
+    if trace_memory:
+        tracemalloc.start()
+    _active, previous = report, _active
+    t0, c0 = time.perf_counter(), time.process_time()
+    try:
+        yield report
+    finally:
+        _active = previous
+        report.meta["total_wall_s"] = round(time.perf_counter() - t0, 6)
+        report.meta["total_cpu_s"] = round(time.process_time() - c0, 6)
+        report.meta["peak_rss_mb"] = peak_rss_mb()
+        if trace_memory:
+            tracemalloc.stop()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report.to_dict(), indent=2, default=str), encoding="utf-8")
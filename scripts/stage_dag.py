@@ -0,0 +1,198 @@
+"""
+Purpose
+Dependency-tracked stage DAG: re-runs only the stages whose inputs changed.
+
+A Node is a stage function plus what determines its result: the nodes it
+reads (deps), parameters, the source code of the functions/modules involved
+and input files. Its fingerprint hashes all of these together with the
+fingerprints of its deps, so a change anywhere upstream changes every
+fingerprint downstream. The fingerprints of written artifacts are kept in a
+JSON manifest; a node with outputs is up to date if its fingerprint matches
+the manifest and all outputs exist, and is then skipped. Before a stale node
+runs, its old artifacts are deleted, and it is recorded only if all its
+outputs exist afterwards: a stage that writes nothing (e.g. a plot with no
+member left) leaves no stale file behind and runs again next time. Optional
+outputs are artifacts a node writes only for some data (the flag CSV of a
+rule without hits); they are deleted like outputs but not required.
+
+Nodes without outputs (the case table, the cube, ...) only produce values
+and run when a stale node needs them. Nodes run level by level in
+topological order; independent nodes of a level run on a thread pool, and
+nodes marked batch=True (plot renders) return a job that is handed to one
+batch runner per level (render_plots, a process pool).
+
+Notes
+Input files are fingerprinted by size and mtime (not contents), so touching
+the CSV rebuilds everything. A failed batch job is not recorded in the
+manifest and is retried on the next run. Outputs must be files.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+from run_report import stage
+
+class Node(NamedTuple):
+    name: str
+    fn: Callable[..., Any]       # called with the values of `deps`, in order
+    deps: list[str] = []
+    params: Any = None           # JSON-able settings (TOP_N, palette, ...)
+    code: list = []              # functions / modules whose source counts
+    inputs: list[Path] = []      # files read directly
+    outputs: list[Path] = []     # artifacts written; none = value-only node
+    batch: bool = False          # fn returns a job for the batch runner
+    optional: list[Path] = []    # artifacts written only for some data
+
+def _artifacts(n: Node) -> list[Path]:
+    return [Path(p) for p in (*n.outputs, *n.optional)]
+
+# =============================================================================
+# Fingerprints
+# =============================================================================
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return repr(obj)
+
+def _file_stamp(path: Path) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{path}:missing"
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+def topo_order(nodes: list[Node]) -> list[Node]:
+    by_name = {n.name: n for n in nodes}
+    order, state = [], {}
+
+    def visit(name: str) -> None:
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Stage cycle at {name!r}")
+        if name not in by_name:
+            raise KeyError(f"Unknown stage {name!r}")
+        state[name] = "visiting"
+        for d in by_name[name].deps:
+            visit(d)
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for n in nodes:
+        visit(n.name)
+    return order
+
+def fingerprints(nodes: list[Node]) -> dict[str, str]:
+    fps: dict[str, str] = {}
+    for n in topo_order(nodes):
+        h = hashlib.sha256()
+        for part in (
+            n.name,
+            _source(n.fn),
+            *(_source(c) for c in n.code),
+            json.dumps(n.params, sort_keys=True, default=str),
+            *(_file_stamp(Path(p)) for p in n.inputs),
+            *(fps[d] for d in n.deps),
+        ):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        fps[n.name] = h.hexdigest()
+    return fps
+
+# =============================================================================
+# Planning / execution
+# =============================================================================
+def load_manifest(path: Path) -> dict[str, str]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path: Path, manifest: dict[str, str]) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+def plan(nodes: list[Node], fps: dict[str, str], manifest: dict[str, str], force: bool = False) -> tuple[set[str], set[str]]:
+    """(stale artifact nodes, all nodes to run = stale + what they need)."""
+    stale = {
+        n.name for n in nodes
+        if _artifacts(n) and (force or manifest.get(n.name) != fps[n.name]
+                              or not all(Path(p).exists() for p in n.outputs))
+    }
+    by_name = {n.name: n for n in nodes}
+    run, todo = set(), list(stale)
+    while todo:
+        name = todo.pop()
+        if name not in run:
+            run.add(name)
+            todo.extend(by_name[name].deps)
+    return stale, run
+
+def _levels(order: list[Node]) -> list[list[Node]]:
+    level: dict[str, int] = {}
+    for n in order:
+        level[n.name] = 1 + max((level[d] for d in n.deps), default=-1)
+    out: list[list[Node]] = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for n in order:
+        out[level[n.name]].append(n)
+    return out
+
+def run_dag(
+    nodes: list[Node],
+    manifest_path: Path,
+    workers: int = 1,
+    batch_runner: Callable[[dict[str, Any]], dict[str, str]] | None = None,
+    force: bool = False,
+) -> dict[str, Any]:
+    """
+    Run the stale nodes (and the value nodes they need); returns the values of
+    the nodes that ran. batch_runner gets {node name: job} for a level's batch
+    nodes and returns {node name: error} for the ones that failed.
+    """
+    order = topo_order(nodes)
+    fps = fingerprints(order)
+    manifest = load_manifest(manifest_path)
+    stale, to_run = plan(order, fps, manifest, force)
+    print(f"Stages: {len(stale)} of {sum(1 for n in order if _artifacts(n))} artifacts out of date.")
+
+    values: dict[str, Any] = {}
+
+    def call(n: Node):
+        for p in _artifacts(n):  # whatever the node does not write again must not survive
+            p.unlink(missing_ok=True)
+        with stage(n.name):
+            return n.fn(*(values[d] for d in n.deps))
+
+    for level in _levels(order):
+        due = [n for n in level if n.name in to_run]
+        plain = [n for n in due if not n.batch]
+        if workers > 1 and len(plain) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(plain))) as pool:
+                for n, v in zip(plain, pool.map(call, plain)):
+                    values[n.name] = v
+        else:
+            for n in plain:
+                values[n.name] = call(n)
+
+        jobs = {n.name: call(n) for n in due if n.batch}
+        failed = batch_runner(jobs) if jobs and batch_runner else {}
+        for n in due:
+            if not _artifacts(n):
+                continue
+            if n.name not in failed and all(Path(p).exists() for p in n.outputs):
+                manifest[n.name] = fps[n.name]
+            else:
+                manifest.pop(n.name, None)
+        save_manifest(manifest_path, manifest)
+    return values
@@ -0,0 +1,123 @@
+"""
+Purpose
+Subgroup discovery: multi-attribute case segments with high OTIF failure.
+
+Segments are conjunctions of selectors (DIMENSION=member, at most one per
+dimension), searched with a beam search over the bitmaps of an
+otif_query.BitmapIndex: a segment's cases are the AND of its selectors'
+bitmaps, its support and failures are popcounts. Candidates below
+min_cases (MIN_CASES in 02c_explore.py) are pruned before scoring, and only
+the best beam_width segments of a level are extended to the next.
+
+Quality is the usual weighted relative accuracy,
+(cases / N) ** alpha * (fail rate - overall fail rate), on case counts
+(metric="rate") or on order value (metric="value").
+
+Notes
+The ranked output has the otif_ranking_all_dimensions.csv columns plus
+depth, lift and quality; "dimension" lists the segment's dimensions and
+"member" its members, joined like otif_cube rollups.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from otif_agg import MISSING_MEMBER
+from otif_cube import DIM_SEP, MEMBER_SEP
+from otif_query import BitmapIndex, all_cases, popcount, query, unpack
+
+BEAM_WIDTH = 20
+MAX_DEPTH = 3
+ALPHA = 0.5
+
+Selector = tuple[str, int]  # (dimension, member code)
+
+def _is_missing(label) -> bool:
+    """Missing-member label of otif_agg.encode_dimension ("nan" or NaN, pandas dependent)."""
+    return str(label) == str(MISSING_MEMBER)
+
+def _value_sum(index: BitmapIndex, words: np.ndarray) -> float:
+    idx = np.flatnonzero(unpack(words, index.n))
+    return float(index.order_value[idx].sum())
+
+def _quality(index: BitmapIndex, words: np.ndarray, n: int, metric: str, alpha: float, base) -> float:
+    fail_words = words & index.flags["IS_OTIF_FAIL"]
+    if metric == "value":
+        total, base_rate = base
+        v = _value_sum(index, words)
+        if v <= 0:
+            return -np.inf
+        return (v / total) ** alpha * (_value_sum(index, fail_words) / v - base_rate)
+    return (n / index.n) ** alpha * (popcount(fail_words) / n - base)
+
+def discover_subgroups(
+    index: BitmapIndex,
+    min_cases: int,
+    beam_width: int = BEAM_WIDTH,
+    max_depth: int = MAX_DEPTH,
+    metric: str = "rate",
+    alpha: float = ALPHA,
+    top: int = 50,
+) -> pd.DataFrame:
+    """Beam search for high-failure segments; best `top` by quality."""
+    if "IS_OTIF_FAIL" not in index.flags:
+        raise ValueError("Index has no IS_OTIF_FAIL flag.")
+    if metric not in ("rate", "value"):
+        raise ValueError(f"metric must be 'rate' or 'value', not {metric!r}")
+    if metric == "value" and index.order_value is None:
+        raise ValueError("metric='value' needs ORDER_VALUE in the index.")
+
+    if metric == "value":
+        total = _value_sum(index, all_cases(index))
+        base = (total, _value_sum(index, index.flags["IS_OTIF_FAIL"]) / total)
+    else:
+        base = popcount(index.flags["IS_OTIF_FAIL"]) / index.n
+
+    dims = list(index.members)
+    selectors: list[Selector] = [(d, m) for d in dims for m in range(len(index.members[d]))
+                                 if not _is_missing(index.members[d][m])]
+
+    scored: dict[tuple[Selector, ...], tuple[float, int]] = {}
+    beam: list[tuple[tuple[Selector, ...], np.ndarray]] = [((), None)]
+    for depth in range(1, max_depth + 1):
+        level = {}
+        for segment, words in beam:
+            used = {d for d, _ in segment}
+            for d, m in selectors:
+                if d in used:
+                    continue  # one selector per dimension
+                cand = tuple(sorted(segment + ((d, m),), key=lambda s: dims.index(s[0])))
+                if cand in level:
+                    continue
+                w = index.bitmaps[d][m] if words is None else words & index.bitmaps[d][m]
+                n = popcount(w)
+                if n < min_cases:
+                    continue  # support pruning: supersets can only be smaller
+                level[cand] = (w, n, _quality(index, w, n, metric, alpha, base))
+        if not level:
+            break
+        for cand, (_, n, q) in level.items():
+            scored[cand] = (q, n)
+        best = sorted(level.items(), key=lambda kv: (-kv[1][2], kv[0]))[:beam_width]
+        beam = [(cand, w) for cand, (w, _, _) in best]
+
+    ranked = sorted(scored.items(), key=lambda kv: (-kv[1][0], kv[0]))[:top]
+    rows = []
+    for segment, (q, _) in ranked:
+        expr = ("and", *[("member", d, index.members[d][m]) for d, m in segment])
+        row = query(index, where=expr).iloc[0].copy()
+        row["dimension"] = DIM_SEP.join(d for d, _ in segment)
+        row["member"] = MEMBER_SEP.join(str(index.members[d][m]) for d, m in segment)
+        row["depth"] = len(segment)
+        row["quality"] = q
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame()
+
+    out = pd.DataFrame(rows).reset_index(drop=True)
+    overall = base if metric == "rate" else base[1]
+    rate_col = "otif_fail_rate_cases" if metric == "rate" else "otif_fail_rate_value"
+    out["lift"] = out[rate_col] / overall if overall else np.nan
+    return out
@@ -0,0 +1,276 @@
+"""
+Purpose
+Seeded synthetic Woodcorp case and activity tables, for scaling runs of
+02c_explore.py without the real data (data/ holds no raw files).
+
+The case table follows the raw export schema (the columns of the flag CSVs
+before the KPI columns): ';' separated, decimal commas in tolerances and
+values, dates as "YYYY-MM-DD HH:MM:SS" (empty if missing). Members are skewed (a few factories
+and carriers carry most orders) and lateness / tolerance violations depend on
+factory, carrier and product, so the rate tables have something to find.
+
+The activity table holds the happy path (docs/methodology.md) plus credit
+checks and rework loops: credit blocks with price rework (about 10% of
+orders), repeated production start date changes, delivery date changes and
+rare quantity changes after loading (see README.md, Key Findings).
+
+Notes
+Everything is generated column-wise with numpy, CHUNK_ROWS cases at a time,
+so tables of tens of millions of cases stream to disk in bounded memory.
+The same seed gives the same files.
+
+Usage: python synth_data.py N_CASES [OUT_DIR] [SEED]
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SEED = 0
+CHUNK_ROWS = 500_000
+FIRST_CASE_KEY = 11_100_000
+
+CASE_COLUMNS = [
+    "CASE_KEY", "DELIVERY_COMPANY", "PRODUCT_TYPE", "FACTORY", "FACTORY_TYPE",
+    "ORDERED_QUANTITY", "DELIVERED_QUANTITY", "MIN_ORDER_TOLERANCE", "MAX_ORDER_TOLERANCE",
+    "CUST_MARKET", "CUST_ID", "CUST_NAME", "CUST_ADDR_CODE", "DAYS_TO_DEL_DEADLINE",
+    "ORDER_TOLERANCE_MET", "ORDER_DATE_MET", "X_CEL_O2C_CASES.SAL_ORD_POS_QUAN",
+    "DELIVERED_QUANTITY_UNIT", "WAREHOUSE_TYPE", "DELIVERED_DATE", "PROMISED_DATE",
+    "CUST_COUNTRY", "ORDER_VALUE", "UNIT_PRICE",
+]
+ACTIVITY_COLUMNS = ["CASE_KEY", "ACTIVITY_EN", "EVENTTIME", "SORTING", "USER_TYPE"]
+
+# member -> (share of orders, extra late probability, extra tolerance violation probability)
+FACTORIES = {
+    "Essen": (0.34, 0.06, 0.04),
+    "Bonn": (0.27, 0.00, 0.02),
+    "Aachen": (0.18, 0.02, 0.00),
+    "Köln": (0.13, 0.10, 0.08),
+    "Dresden": (0.08, 0.15, 0.03),
+}
+CARRIERS = {
+    "DHL": (0.31, 0.00, 0.0),
+    "DB Schenker": (0.24, 0.05, 0.0),
+    "UPS": (0.21, 0.02, 0.0),
+    "Kuehne + Nagel": (0.16, 0.08, 0.0),
+    "DPD": (0.08, 0.20, 0.0),
+}
+PRODUCTS = {"Pallets": (0.62, 0.00, 0.00), "Crates": (0.38, 0.02, 0.07)}
+FACTORY_TYPE = {"Essen": "Own", "Bonn": "Own", "Aachen": "Own", "Köln": "Partner", "Dresden": "Partner"}
+WAREHOUSES = {"Automated": 0.55, "Non-automated": 0.45}
+MARKETS = {"Retail": 0.5, "Construction": 0.35, "Other": 0.15}
+COUNTRIES = {"DE": 0.52, "AT": 0.14, "FR": 0.13, "GR": 0.08, "EE": 0.05, "PL": 0.08}
+
+BASE_LATE = 0.12
+BASE_TOL_VIOLATION = 0.25
+ZERO_PRICE_SHARE = 0.002       # -> flag_unit_price_zero.csv
+ZERO_VALUE_SHARE = 0.003       # -> flag_order_value_zero.csv
+MISSING_DELIVERY_SHARE = 0.005
+
+# (SORTING, activity); HAPPY_STEPS in execution order
+HAPPY_STEPS = [
+    (0, "Order received"),
+    (10, "Confirm sale"),
+    (30, "Start production"),
+    (40, "Finished production"),
+    (50, "Load shipment"),
+    (60, "Goods delivered"),
+]
+CREDIT_CHECK = (19, "Check Credit Score")
+CREDIT_BLOCK = (20, "Credit order block")
+CHANGE_PRICE = (80, "Change price")
+CHANGE_START_DATE = (90, "Change production start date")
+CHANGE_DELIVERY_DATE = (100, "Change delivery date")
+CHANGE_QUANTITY = (170, "Change quantity")
+
+START_DATE = np.datetime64("2019-01-01")
+DAYS_SPAN = 365
+
+# =============================================================================
+# Helpers
+# =============================================================================
+def _pick(rng: np.random.Generator, table: dict, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """(labels, codes) drawn with the table's shares."""
+    labels = np.array(list(table), dtype=object)
+    shares = np.array([v[0] if isinstance(v, tuple) else v for v in table.values()], dtype=float)
+    codes = rng.choice(len(labels), size=n, p=shares / shares.sum())
+    return labels[codes], codes
+
+def _effect(table: dict, codes: np.ndarray, j: int) -> np.ndarray:
+    return np.array([v[j] for v in table.values()])[codes]
+
+def _eu(x: np.ndarray) -> np.ndarray:
+    """Non-negative floats -> '1234,56' (decimal comma, no thousands separator)."""
+    cents = np.rint(np.asarray(x, dtype=float) * 100).astype(np.int64)
+    whole, frac = np.divmod(cents, 100)
+    return np.char.add(np.char.add(whole.astype(str), ","), np.char.zfill(frac.astype(str), 2))
+
+def _write_csv(df: pd.DataFrame, path: Path, sep: str, append: bool) -> None:
+    """pyarrow CSV writer if installed (several times faster), else pandas."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        df.to_csv(path, sep=sep, index=False, mode="a" if append else "w", header=not append,
+                  date_format="%Y-%m-%d %H:%M:%S")
+        return
+    opts = pacsv.WriteOptions(include_header=False, delimiter=sep, quoting_style="none")
+    with open(path, "ab" if append else "wb") as f:
+        if not append:
+            f.write((sep.join(df.columns) + "\n").encode("utf-8"))  # Arrow would quote the header
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), f, opts)
+
+# =============================================================================
+# Case table
+# =============================================================================
+def generate_cases(n: int, seed: int = SEED, first_key: int = FIRST_CASE_KEY) -> pd.DataFrame:
+    """n raw case rows (strings as in the export)."""
+    rng = np.random.default_rng(seed)
+    factory, f_code = _pick(rng, FACTORIES, n)
+    carrier, c_code = _pick(rng, CARRIERS, n)
+    product, p_code = _pick(rng, PRODUCTS, n)
+
+    p_late = BASE_LATE + _effect(FACTORIES, f_code, 1) + _effect(CARRIERS, c_code, 1) + _effect(PRODUCTS, p_code, 1)
+    p_tol = BASE_TOL_VIOLATION + _effect(FACTORIES, f_code, 2) + _effect(PRODUCTS, p_code, 2)
+    late = rng.random(n) < p_late
+    violation = rng.random(n) < p_tol
+
+    ordered = np.maximum(1, np.rint(rng.lognormal(5.0, 1.0, n))).astype(np.int64)
+    tmin = np.where(rng.random(n) < 0.5, 0.0, -10.0)
+    tmax = np.where(rng.random(n) < 0.3, 20.5, 20.0)
+    lo, hi = ordered * (1 + tmin / 100), ordered * (1 + tmax / 100)
+    inside = lo + rng.random(n) * (hi - lo)
+    outside = np.where(rng.random(n) < 0.5, lo * rng.uniform(0.6, 0.97, n), hi * rng.uniform(1.03, 1.4, n))
+    delivered = np.rint(np.where(violation, outside, inside)).astype(np.int64)
+    delivered = np.where(violation, delivered, np.clip(delivered, np.ceil(lo), np.floor(hi)).astype(np.int64))
+
+    promised = START_DATE + rng.integers(0, DAYS_SPAN, n).astype("timedelta64[D]")
+    delay = np.where(late, 1 + rng.geometric(0.3, n), -rng.integers(0, 3, n))
+    delivered_at = promised + delay.astype("timedelta64[D]")
+    one_sec = np.timedelta64(1, "s")  # the export stamps dates at 00:00:01
+    delivered_date = delivered_at.astype("datetime64[s]") + one_sec
+    delivered_date[rng.random(n) < MISSING_DELIVERY_SHARE] = np.datetime64("NaT")
+
+    unit_price = np.round(rng.lognormal(2.3, 0.6, n), 2)
+    unit_price[rng.random(n) < ZERO_PRICE_SHARE] = 0.0
+    value = unit_price * delivered
+    value[rng.random(n) < ZERO_VALUE_SHARE] = 0.0
+
+    cust_id = 60_000 + np.rint(rng.pareto(1.2, n) * 50).astype(np.int64) % 10_000
+    return pd.DataFrame({
+        "CASE_KEY": np.arange(first_key, first_key + n),
+        "DELIVERY_COMPANY": carrier,
+        "PRODUCT_TYPE": product,
+        "FACTORY": factory,
+        "FACTORY_TYPE": np.vectorize(FACTORY_TYPE.get, otypes=[object])(factory),
+        "ORDERED_QUANTITY": ordered,
+        "DELIVERED_QUANTITY": delivered,
+        "MIN_ORDER_TOLERANCE": np.where(tmin == 0, "0", "-10"),
+        "MAX_ORDER_TOLERANCE": np.where(tmax == 20, "20", "20,5"),
+        "CUST_MARKET": _pick(rng, MARKETS, n)[0],
+        "CUST_ID": cust_id,
+        "CUST_NAME": np.char.add("Customer ", cust_id.astype(str)),
+        "CUST_ADDR_CODE": 1,
+        "DAYS_TO_DEL_DEADLINE": -delay,
+        "ORDER_TOLERANCE_MET": (~violation).astype(int),
+        "ORDER_DATE_MET": (~late).astype(int),
+        "X_CEL_O2C_CASES.SAL_ORD_POS_QUAN": delivered,
+        "DELIVERED_QUANTITY_UNIT": "PC",
+        "WAREHOUSE_TYPE": _pick(rng, WAREHOUSES, n)[0],
+        "DELIVERED_DATE": delivered_date,
+        "PROMISED_DATE": promised.astype("datetime64[s]") + one_sec,
+        "CUST_COUNTRY": _pick(rng, COUNTRIES, n)[0],
+        "ORDER_VALUE": _eu(value),
+        "UNIT_PRICE": _eu(unit_price),
+    })[CASE_COLUMNS]
+
+# =============================================================================
+# Activity table
+# =============================================================================
+def generate_activities(cases: pd.DataFrame, seed: int = SEED) -> pd.DataFrame:
+    """Event rows for the cases of generate_cases (file order shuffled)."""
+    rng = np.random.default_rng(seed + 1)
+    n = len(cases)
+    keys = cases["CASE_KEY"].to_numpy()
+    late = cases["ORDER_DATE_MET"].to_numpy() == 0
+    partner = cases["FACTORY_TYPE"].to_numpy() == "Partner"
+
+    # Extra events per case: (activity, count per case)
+    credit_block = rng.random(n) < 0.10
+    extras = [
+        (CREDIT_CHECK, (rng.random(n) < 0.7).astype(np.int64)),
+        (CREDIT_BLOCK, credit_block.astype(np.int64)),
+        (CHANGE_PRICE, credit_block * rng.poisson(1.3, n)),
+        (CHANGE_START_DATE, rng.poisson(np.where(partner, 1.2, 0.4) + late * 0.6)),
+        (CHANGE_DELIVERY_DATE, rng.poisson(0.15 + late * 0.5)),
+        (CHANGE_QUANTITY, (rng.random(n) < 0.02).astype(np.int64)),
+    ]
+
+    # Happy path times: order + step gaps in hours; changes fall between steps
+    order_at = (START_DATE + rng.integers(0, DAYS_SPAN * 24, n).astype("timedelta64[h]")).astype("datetime64[s]")
+    gaps = rng.exponential([1, 24, 72, 24, 48], size=(n, len(HAPPY_STEPS) - 1))
+    gaps[:, 1] += credit_block * rng.exponential(96, n)  # credit blocks delay release
+    hours = np.c_[np.zeros(n), np.cumsum(gaps, axis=1)]
+
+    case_parts, act_parts, sort_parts, hour_parts = [], [], [], []
+    for j, (sorting, name) in enumerate(HAPPY_STEPS):
+        case_parts.append(np.arange(n))
+        act_parts.append(np.full(n, name, dtype=object))
+        sort_parts.append(np.full(n, sorting))
+        hour_parts.append(hours[:, j])
+    for (sorting, name), k in extras:
+        idx = np.repeat(np.arange(n), k)
+        case_parts.append(idx)
+        act_parts.append(np.full(len(idx), name, dtype=object))
+        sort_parts.append(np.full(len(idx), sorting))
+        if name == CHANGE_QUANTITY[1]:
+            hour_parts.append(hours[idx, 4] + rng.uniform(0, 1, len(idx)) * (hours[idx, 5] - hours[idx, 4]))
+        elif name in (CREDIT_CHECK[1], CREDIT_BLOCK[1]):
+            hour_parts.append(hours[idx, 1] + rng.uniform(0, 1, len(idx)) * (hours[idx, 2] - hours[idx, 1]))
+        else:
+            hour_parts.append(rng.uniform(0, 1, len(idx)) * hours[idx, -1])
+
+    case_idx = np.concatenate(case_parts)
+    event_at = order_at[case_idx] + (np.concatenate(hour_parts) * 3600).astype("timedelta64[s]")
+    out = pd.DataFrame({
+        "CASE_KEY": keys[case_idx],
+        "ACTIVITY_EN": np.concatenate(act_parts),
+        "EVENTTIME": event_at.astype("datetime64[ms]"),
+        "SORTING": np.concatenate(sort_parts),
+        "USER_TYPE": "A",
+    })
+    return out.iloc[rng.permutation(len(out))][ACTIVITY_COLUMNS]
+
+# =============================================================================
+# Files
+# =============================================================================
+def write_tables(
+    n: int,
+    out_dir: Path,
+    seed: int = SEED,
+    chunk_rows: int = CHUNK_ROWS,
+    activities: bool = True,
+) -> tuple[Path, Path | None]:
+    """Write case.csv (and activity.csv) for n cases; returns the paths."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    case_path = out_dir / "case.csv"
+    act_path = out_dir / "activity.csv" if activities else None
+
+    for i, start in enumerate(range(0, n, chunk_rows)):
+        cases = generate_cases(min(chunk_rows, n - start), seed=seed + i, first_key=FIRST_CASE_KEY + start)
+        _write_csv(cases, case_path, ";", append=i > 0)
+        if act_path is not None:
+            _write_csv(generate_activities(cases, seed=seed + i), act_path, ",", append=i > 0)
+    return case_path, act_path
+
+if __name__ == "__main__":
+    n_cases = int(sys.argv[1])
+    out = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(__file__).resolve().parents[1] / "data" / "synthetic"
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else SEED
+    paths = write_tables(n_cases, out, seed=seed)
+    print("Wrote:", *[p for p in paths if p is not None])
@@ -0,0 +1,191 @@
+"""
+Purpose
+Throughput times (TPT) between activity pairs, per business dimension and
+split into happy-path vs deviating cases.
+
+Per case and activity pair, the TPT is the time from the first "from" event
+to the last "to" event (days), taken from the sorted event log with segment
+operations only. The durations are joined onto the case table via CASE_KEY
+and summarised per dimension member with a log-bucket quantile sketch
+(DDSketch style): every group is a row of bucket counts, quantiles come
+from cumulative counts, and sketches of different batches merge by adding.
+
+Notes
+Sketch quantiles are within ALPHA relative error of the exact value (values
+below MIN_DAYS count as 0). Negative TPTs (timestamp artifacts, see
+docs/assumptions.md) are kept in mirrored buckets.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from event_log import TS_MISSING, EventLog, SortedEvents, sort_events
+from otif_agg import encode_dimension
+from variants import HAPPY_PATH, Variants
+
+# (name, from activity, to activity)
+TPT_PAIRS = [
+    ("TPT_ORDER_TO_DELIVERY", "Order received", "Goods delivered"),
+    ("TPT_ORDER_TO_PRODUCTION", "Order received", "Start production"),
+    ("TPT_PRODUCTION_TO_SHIPMENT", "Start production", "Load shipment"),
+    ("TPT_SHIPMENT_TO_DELIVERY", "Load shipment", "Goods delivered"),
+]
+
+QUANTILES = [0.25, 0.50, 0.75, 0.90]
+
+ALPHA = 0.01              # relative accuracy of the sketch
+MIN_DAYS = 1 / 1440       # one minute; smaller |TPT| counts as 0
+MAX_DAYS = 100_000.0
+
+NS_PER_DAY = 86_400 * 10**9
+
+# =============================================================================
+# Per-case TPT
+# =============================================================================
+def _first_last(ev: SortedEvents, codes: np.ndarray, last: bool) -> np.ndarray:
+    """Timestamp of the first (or last) event with one of `codes` per segment."""
+    idx = np.flatnonzero(np.isin(ev.activity, codes) & (ev.ts != TS_MISSING))
+    out = np.full(len(ev.starts), TS_MISSING, dtype=np.int64)
+    if not len(idx):
+        return out
+    seg = ev.seg[idx]
+    if last:
+        seg, idx = seg[::-1], idx[::-1]
+    first_of_seg = np.r_[True, seg[1:] != seg[:-1]]
+    out[seg[first_of_seg]] = ev.ts[idx[first_of_seg]]
+    return out
+
+def case_tpt(log: EventLog, pairs: list[tuple[str, str, str]] = TPT_PAIRS, ev: SortedEvents | None = None) -> pd.DataFrame:
+    """TPT in days per case (CASE_KEY x pair); NaN if an activity is missing."""
+    if ev is None:
+        ev = sort_events(log)
+    out = {}
+    for name, start, end in pairs:
+        t0 = _first_last(ev, np.flatnonzero(log.activities == start), last=False)
+        t1 = _first_last(ev, np.flatnonzero(log.activities == end), last=True)
+        ok = (t0 != TS_MISSING) & (t1 != TS_MISSING)
+        days = np.full(len(t0), np.nan)
+        days[ok] = (t1[ok] - t0[ok]) / NS_PER_DAY
+        out[name] = days
+    return pd.DataFrame(out, index=pd.Index(log.case_keys[ev.cases], name="CASE_KEY"))
+
+def happy_path_cases(log: EventLog, variants: Variants, happy_path: list[str] = HAPPY_PATH) -> pd.Series:
+    """
+    IS_HAPPY_PATH per CASE_KEY: the case's variant is exactly the happy path.
+    `variants` is compute_variants(log) of the caller, not recomputed here.
+    """
+    happy = variants.table.loc[variants.table["path"] == " -> ".join(happy_path), "variant"].to_numpy()
+    return pd.Series(np.isin(variants.case_variant, happy), index=pd.Index(log.case_keys, name="CASE_KEY"),
+                     name="IS_HAPPY_PATH")
+
+# =============================================================================
+# Quantile sketch
+# =============================================================================
+class QuantileSketch(NamedTuple):
+    counts: np.ndarray  # (n_groups, 2 * n_buckets + 1): negatives, zero, positives
+    alpha: float = ALPHA
+
+def _gamma(alpha: float) -> float:
+    return (1 + alpha) / (1 - alpha)
+
+def _n_buckets(alpha: float) -> int:
+    return int(np.ceil(np.log(MAX_DAYS / MIN_DAYS) / np.log(_gamma(alpha)))) + 1
+
+def _bucket(x: np.ndarray, alpha: float) -> np.ndarray:
+    """Monotone bucket index: mirrored negatives, zero bucket, positives."""
+    k = _n_buckets(alpha)
+    mag = np.abs(x)
+    with np.errstate(divide="ignore"):
+        i = np.ceil(np.log(np.maximum(mag, MIN_DAYS) / MIN_DAYS) / np.log(_gamma(alpha)))
+    i = np.clip(i, 0, k - 1).astype(np.int64)
+    return np.where(mag < MIN_DAYS, k, np.where(x > 0, k + 1 + i, k - 1 - i))
+
+def _bucket_value(b: np.ndarray, alpha: float) -> np.ndarray:
+    k = _n_buckets(alpha)
+    g = _gamma(alpha)
+    i = np.abs(b - k) - 1
+    mag = MIN_DAYS * 2 * g ** i / (g + 1)
+    return np.where(b == k, 0.0, np.sign(b - k) * mag)
+
+def build_sketch(values: np.ndarray, groups: np.ndarray, n_groups: int, alpha: float = ALPHA) -> QuantileSketch:
+    """One sketch row per group; NaN values are skipped."""
+    ok = ~np.isnan(values)
+    width = 2 * _n_buckets(alpha) + 1
+    key = groups[ok] * width + _bucket(values[ok], alpha)
+    counts = np.bincount(key, minlength=n_groups * width).reshape(n_groups, width)
+    return QuantileSketch(counts, alpha)
+
+def merge_sketches(a: QuantileSketch, b: QuantileSketch) -> QuantileSketch:
+    if a.alpha != b.alpha or a.counts.shape != b.counts.shape:
+        raise ValueError("Sketches differ in accuracy or groups and cannot be merged.")
+    return QuantileSketch(a.counts + b.counts, a.alpha)
+
+def sketch_quantiles(sk: QuantileSketch, qs: list[float] = QUANTILES) -> np.ndarray:
+    """(n_groups, len(qs)) quantile estimates; NaN for empty groups."""
+    cum = np.cumsum(sk.counts, axis=1)
+    n = cum[:, -1]
+    out = np.full((len(n), len(qs)), np.nan)
+    for j, q in enumerate(qs):
+        rank = np.floor(q * (n - 1))
+        b = np.argmax(cum > rank[:, None], axis=1)
+        out[:, j] = np.where(n > 0, _bucket_value(b, sk.alpha), np.nan)
+    return out
+
+# =============================================================================
+# Per-dimension summary
+# =============================================================================
+def _q_name(q: float) -> str:
+    return "median_days" if q == 0.5 else f"p{int(round(q * 100))}_days"
+
+def tpt_by_dimension(
+    cases: pd.DataFrame,
+    tpt: pd.DataFrame,
+    dims: list[str],
+    split: pd.Series,
+    qs: list[float] = QUANTILES,
+) -> pd.DataFrame:
+    """
+    Long table: dimension, member, tpt, path (happy/deviating), cases and
+    sketch quantiles. `split` is a boolean per CASE_KEY (True = happy path).
+    """
+    df = cases.join(tpt, on="CASE_KEY").join(split.rename("_HAPPY"), on="CASE_KEY")
+    happy = df["_HAPPY"].fillna(False).to_numpy(dtype=bool)
+
+    rows = []
+    for dim in dims:
+        codes, members = encode_dimension(df[dim])
+        groups = codes * 2 + (~happy).astype(np.int64)  # 2m = happy, 2m + 1 = deviating
+        for col in tpt.columns:
+            values = df[col].to_numpy(dtype=float)
+            sk = build_sketch(values, groups, 2 * len(members))
+            qv = sketch_quantiles(sk, qs)
+            n = sk.counts.sum(axis=1)
+            part = pd.DataFrame({
+                "dimension": dim,
+                "member": np.repeat(members, 2),
+                "tpt": col,
+                "path": np.tile(["happy", "deviating"], len(members)),
+                "cases": n,
+            })
+            for j, q in enumerate(qs):
+                part[_q_name(q)] = qv[:, j]
+            rows.append(part)
+    if not rows:
+        return pd.DataFrame()
+    return pd.concat(rows, ignore_index=True)
+
+def happy_path_delta(summary: pd.DataFrame) -> pd.DataFrame:
+    """Per dimension member and TPT: deviating minus happy-path median (days)."""
+    wide = summary.set_index(["dimension", "member", "tpt", "path"])[["cases", "median_days"]].unstack("path")
+    out = pd.DataFrame({
+        "cases_happy": wide[("cases", "happy")],
+        "cases_deviating": wide[("cases", "deviating")],
+        "median_days_happy": wide[("median_days", "happy")],
+        "median_days_deviating": wide[("median_days", "deviating")],
+    })
+    out["delta_median_days"] = out["median_days_deviating"] - out["median_days_happy"]
+    return out.reset_index()